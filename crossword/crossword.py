@@ -1,3 +1,6 @@
+import numpy as np
+
+
 class Variable():
 
     ACROSS = "across"
@@ -35,6 +38,16 @@ class Variable():
         return f"Variable({self.i}, {self.j}, {direction}, {self.length})"
 
 
+class Overlaps(dict):
+    """
+    Mapping from pairs of variables to their overlap, where pairs that
+    do not overlap are not stored and look up as None.
+    """
+
+    def __missing__(self, key):
+        return None
+
+
 class Crossword():
 
     def __init__(self, structure_file, words_file):
@@ -45,89 +58,133 @@ class Crossword():
             self.height = len(contents)
             self.width = max(len(line) for line in contents)
 
-            self.structure = []
-            for i in range(self.height):
-                row = []
-                for j in range(self.width):
-                    if j >= len(contents[i]):
-                        row.append(False)
-                    elif contents[i][j] == "_":
-                        row.append(True)
-                    else:
-                        row.append(False)
-                self.structure.append(row)
+            self.structure = np.array(
+                [[c == "_" for c in line.ljust(self.width)]
+                 for line in contents],
+                dtype=bool
+            ).reshape(self.height, self.width)
 
         # Save vocabulary list
         with open(words_file) as f:
             self.words = set(f.read().upper().splitlines())
 
-        # Determine variable set
-        self.variables = set()
-        for i in range(self.height):
-            for j in range(self.width):
-
-                # Vertical words
-                starts_word = (
-                    self.structure[i][j]
-                    and (i == 0 or not self.structure[i - 1][j])
-                )
-                if starts_word:
-                    length = 1
-                    for k in range(i + 1, self.height):
-                        if self.structure[k][j]:
-                            length += 1
-                        else:
-                            break
-                    if length > 1:
-                        self.variables.add(Variable(
-                            i=i, j=j,
-                            direction=Variable.DOWN,
-                            length=length
-                        ))
-
-                # Horizontal words
-                starts_word = (
-                    self.structure[i][j]
-                    and (j == 0 or not self.structure[i][j - 1])
-                )
-                if starts_word:
-                    length = 1
-                    for k in range(j + 1, self.width):
-                        if self.structure[i][k]:
-                            length += 1
-                        else:
-                            break
-                    if length > 1:
-                        self.variables.add(Variable(
-                            i=i, j=j,
-                            direction=Variable.ACROSS,
-                            length=length
-                        ))
+        # Determine variable set, remembering which across and which down
+        # variable (as an index into `variables`, or -1) covers each cell
+        variables = []
+        cell_vars = {
+            Variable.ACROSS: np.full(self.structure.shape, -1),
+            Variable.DOWN: np.full(self.structure.shape, -1)
+        }
+        for direction, grid in ((Variable.ACROSS, self.structure),
+                                (Variable.DOWN, self.structure.T)):
+
+            # Runs of open cells start where the padded row steps from
+            # closed to open and end where it steps back
+            padded = np.zeros((grid.shape[0], grid.shape[1] + 2), dtype=np.int8)
+            padded[:, 1:-1] = grid
+            steps = np.diff(padded, axis=1)
+            starts = zip(*np.nonzero(steps == 1))
+            ends = np.nonzero(steps == -1)[1]
+            for (row, start), end in zip(starts, ends):
+                length = int(end - start)
+                if length < 2:
+                    continue
+                if direction == Variable.ACROSS:
+                    i, j = int(row), int(start)
+                    cell_vars[direction][i, j:j + length] = len(variables)
+                else:
+                    i, j = int(start), int(row)
+                    cell_vars[direction][i:i + length, j] = len(variables)
+                variables.append(Variable(
+                    i=i, j=j, direction=direction, length=length
+                ))
+        self.variables = set(variables)
 
         # Compute overlaps for each word
         # For any pair of variables v1, v2, their overlap is either:
         #    None, if the two variables do not overlap; or
         #    (i, j), where v1's ith character overlaps v2's jth character
-        self.overlaps = dict()
-        for v1 in self.variables:
-            for v2 in self.variables:
-                if v1 == v2:
-                    continue
-                cells1 = v1.cells
-                cells2 = v2.cells
-                intersection = set(cells1).intersection(cells2)
-                if not intersection:
-                    self.overlaps[v1, v2] = None
-                else:
-                    intersection = intersection.pop()
-                    self.overlaps[v1, v2] = (
-                        cells1.index(intersection),
-                        cells2.index(intersection)
-                    )
+        # Only cells covered by both an across and a down variable overlap
+        self.overlaps = Overlaps()
+        self.neighbor_sets = {var: set() for var in variables}
+        across_vars = cell_vars[Variable.ACROSS]
+        down_vars = cell_vars[Variable.DOWN]
+        for i, j in zip(*np.nonzero((across_vars >= 0) & (down_vars >= 0))):
+            across = variables[across_vars[i, j]]
+            down = variables[down_vars[i, j]]
+            self.overlaps[across, down] = (int(j) - across.j, int(i) - down.i)
+            self.overlaps[down, across] = (int(i) - down.i, int(j) - across.j)
+            self.neighbor_sets[across].add(down)
+            self.neighbor_sets[down].add(across)
+        self.neighbor_sets = {
+            var: frozenset(neighbors)
+            for var, neighbors in self.neighbor_sets.items()
+        }
 
     def neighbors(self, var):
         """Given a variable, return set of overlapping variables."""
-        return set(
-            v for v in self.variables
-            if v != var and self.overlaps[v, var]
-        )
+        return self.neighbor_sets[var]
+
+    def components(self, variables=None):
+        """
+        Split `variables` (all variables by default) into connected
+        components of the overlap graph, returning a list of sets.
+        """
+        if variables is None:
+            variables = self.variables
+        variables = set(variables)
+        components = []
+        while variables:
+            frontier = [variables.pop()]
+            component = set(frontier)
+            while frontier:
+                for neighbor in self.neighbor_sets[frontier.pop()]:
+                    if neighbor in variables:
+                        variables.remove(neighbor)
+                        component.add(neighbor)
+                        frontier.append(neighbor)
+            components.append(component)
+        return components
+
+    def cut_variables(self, variables):
+        """
+        Return the set of variables in `variables` whose removal would
+        disconnect the overlap graph restricted to `variables`.
+        """
+        variables = set(variables)
+        order = dict()
+        low = dict()
+        cuts = set()
+        for root in variables:
+            if root in order:
+                continue
+            order[root] = low[root] = len(order)
+            root_children = 0
+
+            # Iterative depth-first search tracking the lowest discovery
+            # order reachable from each subtree
+            stack = [(root, None, iter(self.neighbor_sets[root] & variables))]
+            while stack:
+                var, parent, children = stack[-1]
+                for child in children:
+                    if child not in order:
+                        order[child] = low[child] = len(order)
+                        stack.append((
+                            child, var,
+                            iter(self.neighbor_sets[child] & variables)
+                        ))
+                        break
+                    elif child is not parent:
+                        low[var] = min(low[var], order[child])
+                else:
+                    stack.pop()
+                    if parent is None:
+                        continue
+                    low[parent] = min(low[parent], low[var])
+                    if parent == root:
+                        root_children += 1
+                    elif low[var] >= order[parent]:
+                        cuts.add(parent)
+            if root_children > 1:
+                cuts.add(root)
+        return cuts
@@ -1,15 +1,82 @@
+import itertools
+import json
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 
 from crossword import *
 
+FONT_PATH = "assets/fonts/OpenSans-Regular.ttf"
+
+# Fonts and pre-rendered letter tiles, shared by every render
+FONTS = dict()
+GLYPHS = dict()
+
+
+class SearchStats():
+    """
+    Counters and timers collected while solving a crossword.
+    """
+
+    TIMERS = ("ac3", "selection", "ordering", "consistency")
+
+    def __init__(self):
+        self.nodes = 0
+        self.backtracks = 0
+        self.revise_calls = 0
+        self.values_pruned = 0
+        self.times = {name: 0.0 for name in SearchStats.TIMERS}
+
+    def add_time(self, name, start):
+        """
+        Add the time elapsed since `start` (from `time.perf_counter`)
+        to the timer called `name`.
+        """
+        self.times[name] += time.perf_counter() - start
+
+    def as_dict(self):
+        """
+        Return the collected statistics as a JSON-serialisable dict.
+        """
+        return {
+            "nodes": self.nodes,
+            "backtracks": self.backtracks,
+            "revise_calls": self.revise_calls,
+            "values_pruned": self.values_pruned,
+            "times": dict(self.times)
+        }
+
+    def __str__(self):
+        lines = [
+            f"Nodes expanded: {self.nodes}",
+            f"Backtracks: {self.backtracks}",
+            f"Revise calls: {self.revise_calls}",
+            f"Values pruned: {self.values_pruned}"
+        ]
+        for name in SearchStats.TIMERS:
+            lines.append(f"Time in {name}: {self.times[name]:.4f}s")
+        return "\n".join(lines)
+
 
 class CrosswordCreator():
 
-    def __init__(self, crossword):
+    def __init__(self, crossword, stats=None,
+                 on_assign=None, on_unassign=None, on_prune=None):
         """
         Create new CSP crossword generate.
+
+        `stats` may be a `SearchStats` object to collect counters and
+        timers during search. `on_assign(var, word)`,
+        `on_unassign(var, word)` and `on_prune(var, word)` are optional
+        callbacks fired when the search assigns a word, takes it back,
+        or removes it from a domain. With none of these set, search
+        does no extra bookkeeping.
         """
         self.crossword = crossword
+        self.stats = stats
+        self.on_assign = on_assign
+        self.on_unassign = on_unassign
+        self.on_prune = on_prune
         self.domains_of_x = {
             var: self.crossword.words.copy()
             for var in self.crossword.variables
@@ -44,55 +111,385 @@ class CrosswordCreator():
                     print("█", end="")
             print()
 
-    def save(self, assignment, filename):
+    def glyphs(self, font_size, tile_size):
         """
-        Save crossword assignment to an image file.
+        Return a dict mapping each letter of the crossword's words to a
+        `tile_size` x `tile_size` grayscale array of that letter drawn
+        black on white. Tiles are cached per size and shared between
+        crosswords, rendering letters the first time they are needed.
         """
         from PIL import Image, ImageDraw, ImageFont
-        cell_size = 100
+        import numpy as np
+
+        tiles = GLYPHS.setdefault((font_size, tile_size), dict())
+        missing = set("".join(self.crossword.words)) - tiles.keys()
+        if not missing:
+            return tiles
+
+        if font_size not in FONTS:
+            FONTS[font_size] = ImageFont.truetype(FONT_PATH, font_size)
+        font = FONTS[font_size]
+
+        for letter in missing:
+            tile = Image.new("L", (tile_size, tile_size), 255)
+            draw = ImageDraw.Draw(tile)
+            left, top, right, bottom = draw.textbbox((0, 0), letter, font=font)
+            draw.text(
+                ((tile_size - (right - left)) / 2 - left,
+                 (tile_size - (bottom - top)) / 2 - top),
+                letter, fill=0, font=font
+            )
+            tiles[letter] = np.asarray(tile)
+        return tiles
+
+    def render(self, assignment, cell_size=100):
+        """
+        Return an RGBA image of a crossword assignment as a NumPy array
+        of shape (height * cell_size, width * cell_size, 4).
+        """
+        import numpy as np
+
         cell_border = 2
         interior_size = cell_size - 2 * cell_border
         letters = self.letter_grid(assignment)
+        glyphs = self.glyphs(int(cell_size * 0.8), interior_size)
 
-        # Create a blank canvas
-        img = Image.new(
-            "RGBA",
-            (self.crossword.width * cell_size,
-             self.crossword.height * cell_size),
-            "black"
-        )
-        font = ImageFont.truetype("assets/fonts/OpenSans-Regular.ttf", 80)
-        draw = ImageDraw.Draw(img)
+        # Black canvas with a white interior for every open cell
+        cell = np.zeros((cell_size, cell_size), dtype=bool)
+        cell[cell_border:-cell_border, cell_border:-cell_border] = True
+        white = np.kron(np.asarray(self.crossword.structure), cell) > 0
+        canvas = np.zeros(white.shape + (4,), dtype=np.uint8)
+        canvas[..., 3] = 255
+        canvas[white, :3] = 255
 
+        # Paste letter tiles
         for i in range(self.crossword.height):
             for j in range(self.crossword.width):
+                if self.crossword.structure[i][j] and letters[i][j]:
+                    top = i * cell_size + cell_border
+                    left = j * cell_size + cell_border
+                    canvas[top:top + interior_size,
+                           left:left + interior_size,
+                           :3] = glyphs[letters[i][j]][..., None]
+        return canvas
+
+    def save(self, assignment, filename, cell_size=100):
+        """
+        Save crossword assignment to an image file.
+        """
+        from PIL import Image
+        Image.fromarray(self.render(assignment, cell_size), "RGBA").save(
+            filename)
 
-                rect = [
-                    (j * cell_size + cell_border,
-                     i * cell_size + cell_border),
-                    ((j + 1) * cell_size - cell_border,
-                     (i + 1) * cell_size - cell_border)
-                ]
-                if self.crossword.structure[i][j]:
-                    draw.rectangle(rect, fill="white")
-                    if letters[i][j]:
-                        w, h = draw.textsize(letters[i][j], font=font)
-                        draw.text(
-                            (rect[0][0] + ((interior_size - w) / 2),
-                             rect[0][1] + ((interior_size - h) / 2) - 10),
-                            letters[i][j], fill="black", font=font
-                        )
+    def save_many(self, assignments, filename, columns=None, cell_size=100):
+        """
+        Save several crossword assignments to a single file.
 
-        img.save(filename)
+        If `columns` is None, write one page per assignment (the format
+        given by `filename` must support multiple pages, e.g. PDF, TIFF
+        or GIF). Otherwise, lay the assignments out on a sprite sheet
+        `columns` puzzles wide.
+        """
+        from PIL import Image
+        import numpy as np
+
+        assignments = list(assignments)
+        if not assignments:
+            raise ValueError("No assignments to save")
+
+        if columns is None:
+            pages = [
+                Image.fromarray(self.render(assignment, cell_size)[..., :3])
+                for assignment in assignments
+            ]
+            pages[0].save(filename, save_all=True, append_images=pages[1:])
+            return
+
+        rows = -(-len(assignments) // columns)
+        puzzle_height = self.crossword.height * cell_size
+        puzzle_width = self.crossword.width * cell_size
+        sheet = np.zeros(
+            (rows * puzzle_height, columns * puzzle_width, 4), dtype=np.uint8)
+        sheet[..., 3] = 255
+        for k, assignment in enumerate(assignments):
+            top = (k // columns) * puzzle_height
+            left = (k % columns) * puzzle_width
+            sheet[top:top + puzzle_height,
+                  left:left + puzzle_width] = self.render(assignment, cell_size)
+        Image.fromarray(sheet, "RGBA").save(filename)
 
     def solve(self):
         """
         Enforce node and arc consistency, and then solve the CSP.
         """
         self.enforce_node_consistency()
-        self.ac3()
+        self._timed("ac3", self.ac3)
         return self.backtrack(dict())
 
+    def iter_solutions(self, limit=None):
+        """
+        Yield complete assignments one at a time, resuming the same search
+        after each solution rather than starting over. Stop after `limit`
+        solutions if `limit` is not None.
+
+        Only the current partial assignment is kept in memory, so the best
+        of many grids can be picked with e.g.
+        `max(creator.iter_solutions(100), key=score)`.
+        """
+        self.enforce_node_consistency()
+        if not self._timed("ac3", self.ac3):
+            return
+        domains = {
+            var: set(words) for var, words in self.domains_of_x.items()
+        }
+        solutions = self.search(dict(), domains)
+        if limit is not None:
+            solutions = itertools.islice(solutions, limit)
+        yield from solutions
+
+    def count_solutions(self):
+        """
+        Return the number of complete assignments that solve the crossword.
+
+        Subproblems are cached by the remaining domains of the unassigned
+        variables, so partial assignments that differ only in the order or
+        placement of words already chosen share one cache entry.
+        """
+        self.enforce_node_consistency()
+        if not self._timed("ac3", self.ac3):
+            return 0
+        domains = {
+            var: set(words) for var, words in self.domains_of_x.items()
+        }
+        return self.count(domains, dict())
+
+    def solve_components(self, parallel=False, split=False):
+        """
+        Enforce node and arc consistency, then solve each connected
+        component of the crossword separately and merge the results,
+        keeping words distinct across the whole grid.
+
+        If `parallel` is True, components are first solved in separate
+        processes; if their words clash, they are re-solved in turn with
+        each other's words excluded. If `split` is True, components are
+        further divided by assigning a variable that disconnects them.
+
+        Return a complete assignment, or None if there is none.
+        """
+        self.enforce_node_consistency()
+        if not self._timed("ac3", self.ac3):
+            return None
+        domains = {
+            var: set(words) for var, words in self.domains_of_x.items()
+        }
+        components = self.crossword.components()
+
+        if parallel and len(components) > 1:
+            with ProcessPoolExecutor() as executor:
+                parts = list(executor.map(
+                    solve_component,
+                    [self.crossword] * len(components),
+                    [{var: domains[var] for var in component}
+                     for component in components],
+                    [split] * len(components)
+                ))
+            if any(part is None for part in parts):
+                return None
+            assignment = dict()
+            for part in parts:
+                assignment.update(part)
+            if len(set(assignment.values())) == len(assignment):
+                return assignment
+
+        return next(self.merge(components, domains, split), None)
+
+    def merge(self, components, domains, split):
+        """
+        Generate assignments to every variable in `components`, a list of
+        disjoint sets of variables that do not overlap one another, by
+        solving each component in turn with the words used by earlier
+        components removed from its domains.
+        """
+        if not components:
+            yield dict()
+            return
+
+        first, rest = components[0], components[1:]
+        for partial in self.component_solutions(
+                first, {var: domains[var] for var in first}, split):
+            used = set(partial.values())
+            remaining = {
+                var: domains[var] - used
+                for component in rest for var in component
+            }
+            if not all(remaining.values()):
+                continue
+            for others in self.merge(rest, remaining, split):
+                others.update(partial)
+                yield others
+
+    def component_solutions(self, component, domains, split):
+        """
+        Generate assignments to the connected set of variables
+        `component`, whose remaining words are given by `domains`.
+
+        If `split` is True and some variable disconnects the component,
+        assign that variable first and merge solutions of the pieces left
+        behind.
+        """
+        cuts = self.crossword.cut_variables(component) if split else None
+        if not cuts:
+            yield from self.search(dict(), domains)
+            return
+
+        # Cut at the variable leaving the smallest largest piece
+        pieces = {
+            cut: self.crossword.components(component - {cut})
+            for cut in cuts
+        }
+        cut = min(
+            pieces, key=lambda var: max(len(piece) for piece in pieces[var])
+        )
+        for value in sorted(domains[cut]):
+            reduced = self.forward_check(cut, value, domains)
+            if reduced is None:
+                continue
+            for assignment in self.merge(pieces[cut], reduced, split):
+                assignment[cut] = value
+                yield assignment
+
+    def search(self, assignment, domains):
+        """
+        Generate every complete assignment extending `assignment`, where
+        `domains` maps each unassigned variable to its remaining words.
+        `assignment` is extended in place and restored on return, so each
+        yielded solution is a copy.
+        """
+        if self.stats is not None:
+            self.stats.nodes += 1
+
+        if not domains:
+            yield assignment.copy()
+            return
+
+        var = self._timed("selection", self.select_from_domains, domains)
+        for value in sorted(domains[var]):
+            reduced = self._timed(
+                "consistency", self.forward_check, var, value, domains)
+            solved = False
+            if reduced is not None:
+                assignment[var] = value
+                if self.on_assign is not None:
+                    self.on_assign(var, value)
+                for solution in self.search(assignment, reduced):
+                    solved = True
+                    yield solution
+                del assignment[var]
+                if self.on_unassign is not None:
+                    self.on_unassign(var, value)
+
+            # Only values leading to no solution count as backtracks
+            if not solved and self.stats is not None:
+                self.stats.backtracks += 1
+
+    def count(self, domains, cache):
+        """
+        Return the number of ways to complete the variables in `domains`,
+        using `cache` to share results between identical subproblems.
+        """
+        if not domains:
+            return 1
+
+        key = frozenset(
+            (var, frozenset(words)) for var, words in domains.items()
+        )
+        if key in cache:
+            return cache[key]
+
+        if self.stats is not None:
+            self.stats.nodes += 1
+        var = self.select_from_domains(domains)
+        total = 0
+        for value in domains[var]:
+            reduced = self.forward_check(var, value, domains)
+            if reduced is not None:
+                total += self.count(reduced, cache)
+        cache[key] = total
+        return total
+
+    def select_from_domains(self, domains):
+        """
+        Return the variable in `domains` with the fewest remaining words,
+        breaking ties by the highest degree.
+        """
+        return min(
+            domains,
+            key=lambda var: (
+                len(domains[var]), -len(self.crossword.neighbors(var))
+            )
+        )
+
+    def forward_check(self, var, value, domains):
+        """
+        Return the domains of the other unassigned variables after
+        assigning `value` to `var`: overlapping variables keep only
+        words with a matching letter, and no variable may reuse `value`.
+
+        Return None if any domain ends up empty.
+        """
+        reduced = dict()
+        for other, words in domains.items():
+            if other == var:
+                continue
+            overlap = self.crossword.overlaps[var, other]
+            if overlap:
+                letter = value[overlap[0]]
+                kept = {
+                    word for word in words
+                    if word[overlap[1]] == letter and word != value
+                }
+            elif value in words:
+                kept = words - {value}
+            else:
+                kept = words
+            if self.stats is not None or self.on_prune is not None:
+                for word in words - kept:
+                    self.pruned(other, word)
+            words = kept
+            if not words:
+                return None
+            reduced[other] = words
+        return reduced
+
+    def _timed(self, name, function, *args):
+        """
+        Call `function(*args)`, adding its running time to the timer
+        `name` if statistics are being collected.
+        """
+        if self.stats is None:
+            return function(*args)
+        start = time.perf_counter()
+        result = function(*args)
+        self.stats.add_time(name, start)
+        return result
+
+    def prune(self, var, word):
+        """
+        Remove `word` from the domain of `var`.
+        """
+        self.domains_of_x[var].remove(word)
+        self.pruned(var, word)
+
+    def pruned(self, var, word):
+        """
+        Count the removal of `word` from a domain of `var` and report it
+        to the `on_prune` hook.
+        """
+        if self.stats is not None:
+            self.stats.values_pruned += 1
+        if self.on_prune is not None:
+            self.on_prune(var, word)
+
     def enforce_node_consistency(self):
         """
         Update `self.domains` such that each variable is node-consistent.
@@ -102,7 +499,7 @@ class CrosswordCreator():
         for var in self.crossword.variables:
             for word in self.domains_of_x[var].copy():
                 if len(word) != var.length:
-                    self.domains_of_x[var].remove(word)
+                    self.prune(var, word)
 
     def revise(self, x, y):
         """
@@ -113,12 +510,14 @@ class CrosswordCreator():
         Return True if a revision was made to the domain of `x`; return
         False if no revision was made.
         """
+        if self.stats is not None:
+            self.stats.revise_calls += 1
         overlap = self.crossword.overlaps[x, y]
         revised = False
         if overlap:
-            for x_word in self.domains_of_x[x]:
+            for x_word in list(self.domains_of_x[x]):
                 if not [True if y_word[overlap[1]] == x_word[overlap[0]] else None for y_word in self.domains_of_x[y]]:
-                    self.domains_of_x[x].remove(x_word)
+                    self.prune(x, x_word)
                     revised = True
 
         return revised
@@ -246,46 +645,100 @@ class CrosswordCreator():
         If no assignment is possible, return None.
         """
 
+        if self.stats is not None:
+            self.stats.nodes += 1
+
         if self.assignment_complete(assignment):
             return assignment
 
-        var = self.select_unassigned_variable(assignment)
-        for value in self.order_domain_values(var, assignment):
+        var = self._timed(
+            "selection", self.select_unassigned_variable, assignment)
+        for value in self._timed(
+                "ordering", self.order_domain_values, var, assignment):
             new_assignment = assignment.copy()
             new_assignment[var] = value
+            if self.on_assign is not None:
+                self.on_assign(var, value)
             arcs = [(neighbor, var)
                     for neighbor in self.crossword.neighbors(var)]
-            self.ac3(arcs=arcs)
-            if self.consistent(new_assignment):
+            self._timed("ac3", self.ac3, arcs)
+            if self._timed("consistency", self.consistent, new_assignment):
                 result = self.backtrack(new_assignment)
                 if result:
                     return result
+            if self.stats is not None:
+                self.stats.backtracks += 1
+            if self.on_unassign is not None:
+                self.on_unassign(var, value)
         return None
 
 
+def solve_component(crossword, domains, split):
+    """
+    Return the first assignment to the connected variables in `domains`,
+    or None. Used to solve components in worker processes.
+    """
+    creator = CrosswordCreator(crossword)
+    return next(
+        creator.component_solutions(set(domains), domains, split), None)
+
+
 def main():
 
+    # Pull out optional flags
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    flags = [arg for arg in sys.argv[1:] if arg.startswith("--")]
+    stats_format = None
+    solutions = None
+    for flag in flags:
+        if flag == "--stats":
+            stats_format = "text"
+        elif flag == "--stats=json":
+            stats_format = "json"
+        elif flag.startswith("--solutions="):
+            solutions = int(flag[len("--solutions="):])
+        else:
+            sys.exit(f"Unknown option: {flag}")
+
     # Check usage
-    if len(sys.argv) not in [3, 4]:
-        sys.exit("Usage: python generate.py structure words [output]")
+    if len(args) not in [2, 3]:
+        sys.exit("Usage: python generate.py [--stats[=json]] [--solutions=N] "
+                 "structure words [output]")
 
     # Parse command-line arguments
-    structure = sys.argv[1]
-    words = sys.argv[2]
-    output = sys.argv[3] if len(sys.argv) == 4 else None
+    structure = args[0]
+    words = args[1]
+    output = args[2] if len(args) == 3 else None
 
     # Generate crossword
     crossword = Crossword(structure, words)
-    creator = CrosswordCreator(crossword)
-    assignment = creator.solve()
+    stats = SearchStats() if stats_format else None
+    creator = CrosswordCreator(crossword, stats=stats)
+    if solutions is None:
+        assignments = [creator.solve()]
+        if assignments[0] is None:
+            assignments = []
+    else:
+        assignments = list(creator.iter_solutions(limit=solutions))
+
+    # Report search statistics
+    if stats_format == "json":
+        print(json.dumps(stats.as_dict()), file=sys.stderr)
+    elif stats_format == "text":
+        print(stats, file=sys.stderr)
 
     # Print result
-    if assignment is None:
+    if not assignments:
         print("No solution.")
     else:
-        creator.print(assignment)
-        if output:
-            creator.save(assignment, output)
+        for k, assignment in enumerate(assignments):
+            if k:
+                print()
+            creator.print(assignment)
+        if output and solutions is None:
+            creator.save(assignments[0], output)
+        elif output:
+            creator.save_many(assignments, output)
 
 
 if __name__ == "__main__":
@@ -1,6 +1,374 @@
+import functools
 import itertools
+import math
 import random
-import copy
+import time
+from collections import defaultdict, deque
+from fractions import Fraction
+
+import numpy as np
+
+# Cells are stored as bits of an integer mask, where cell (i, j)
+# on a board `width` cells wide is bit number i * width + j.
+
+# Chance that a cell is a mine, assumed when the AI is not told
+# how many mines there are (8 mines on the default 8x8 board)
+DEFAULT_DENSITY = Fraction(8, 64)
+
+
+def cells_mask(cells, width):
+    """
+    Returns the bitmask of an iterable of (i, j) cells.
+    """
+    mask = 0
+    for i, j in cells:
+        mask |= 1 << (i * width + j)
+    return mask
+
+
+def mask_indices(mask):
+    """
+    Yields the bit numbers set in `mask`, lowest first.
+    """
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def mask_cells(mask, width):
+    """
+    Returns the set of (i, j) cells in a bitmask.
+    """
+    return {divmod(index, width) for index in mask_indices(mask)}
+
+
+@functools.lru_cache(maxsize=None)
+def neighbor_masks(height, width):
+    """
+    Returns a tuple giving, for each bit number, the bitmask of
+    the cells within one row and column of that cell, not including
+    the cell itself.
+    """
+    masks = []
+    for i in range(height):
+        for j in range(width):
+            mask = 0
+            for k in range(max(i - 1, 0), min(i + 2, height)):
+                for l in range(max(j - 1, 0), min(j + 2, width)):
+                    if (k, l) != (i, j):
+                        mask |= 1 << (k * width + l)
+            masks.append(mask)
+    return tuple(masks)
+
+
+def neighbor_counts(grid):
+    """
+    Returns an array of the same shape as the boolean array `grid`
+    counting, for each cell, the True cells within one row and column
+    of it, not including the cell itself.
+    """
+    height, width = grid.shape
+    padded = np.pad(grid.astype(np.int8), 1)
+    counts = np.zeros((height, width), dtype=np.int8)
+    for di in range(3):
+        for dj in range(3):
+            if (di, dj) != (1, 1):
+                counts += padded[di:di + height, dj:dj + width]
+    return counts
+
+
+# Exact tables of components already enumerated, by constraints, oldest
+# first; estimated tables are never kept
+EXACT_TABLES = dict()
+EXACT_TABLES_SIZE = 1024
+
+
+def component_solutions(constraints, deadline, samples):
+    """
+    Counts the mine configurations consistent with `constraints`, a
+    sorted tuple of (mask, count) pairs whose cells form one connected
+    component, as a tuple of (cells, table) where `cells` is a tuple of
+    bit numbers and `table` maps each possible number of mines k to a
+    pair (solutions, mine counts), giving the number of configurations
+    with k mines and how many of them have a mine in each cell.
+
+    Enumerating every configuration may take half of the time left
+    until `deadline`, a time from `time.perf_counter()`. If it is not
+    done by then, the counts are instead estimated by importance
+    sampling from up to `samples` random configurations, stopping at
+    the deadline once one is found.
+    """
+    if constraints in EXACT_TABLES:
+        result = EXACT_TABLES.pop(constraints)
+        EXACT_TABLES[constraints] = result
+        return result
+
+    cells = []
+    position = dict()
+    for mask, count in constraints:
+        for index in mask_indices(mask):
+            if index not in position:
+                position[index] = len(cells)
+                cells.append(index)
+
+    # Constraints touching each cell, with the mines still to place and
+    # cells still unassigned in each constraint
+    members = [[] for _ in cells]
+    remaining = []
+    unassigned = []
+    for k, (mask, count) in enumerate(constraints):
+        remaining.append(count)
+        unassigned.append(mask.bit_count())
+        for index in mask_indices(mask):
+            members[position[index]].append(k)
+
+    table = dict()
+
+    def record(values, mines, weight=1):
+        if mines not in table:
+            table[mines] = [0, [0] * len(cells)]
+        entry = table[mines]
+        entry[0] += weight
+        for p, value in enumerate(values):
+            entry[1][p] += value * weight
+
+    def enumerate_all(deadline):
+        """
+        Depth-first search over every configuration, recording each
+        consistent one. Returns False if it ran out of time.
+        """
+        values = [None] * len(cells)
+        options = [[1, 0]]
+        mines = 0
+        steps = 0
+        while options:
+            steps += 1
+            if not steps % 1024 and time.perf_counter() > deadline:
+                return False
+            p = len(options) - 1
+            if values[p] is not None:
+                for k in members[p]:
+                    unassigned[k] += 1
+                    remaining[k] += values[p]
+                mines -= values[p]
+                values[p] = None
+            if not options[p]:
+                options.pop()
+                continue
+            value = options[p].pop()
+            values[p] = value
+            mines += value
+            consistent = True
+            for k in members[p]:
+                unassigned[k] -= 1
+                remaining[k] -= value
+                if not 0 <= remaining[k] <= unassigned[k]:
+                    consistent = False
+            if not consistent:
+                continue
+            if p + 1 < len(cells):
+                options.append([1, 0])
+                continue
+            record(values, mines)
+        return True
+
+    def sample():
+        """
+        Assigns the cells in turn, each a random value among those
+        leaving every constraint satisfiable, and records a complete
+        configuration weighted by the inverse of its chance of being
+        drawn, so that weighted counts estimate the true ones.
+        """
+        values = []
+        weight = 1
+        for p in range(len(cells)):
+            allowed = [
+                value for value in (0, 1)
+                if all(0 <= remaining[k] - value <= unassigned[k] - 1
+                       for k in members[p])
+            ]
+            if not allowed:
+                break
+            weight *= len(allowed)
+            value = random.choice(allowed)
+            values.append(value)
+            for k in members[p]:
+                unassigned[k] -= 1
+                remaining[k] -= value
+        else:
+            record(values, sum(values), weight)
+
+        # Undo the assignment so the next sample starts afresh
+        for p, value in enumerate(values):
+            for k in members[p]:
+                unassigned[k] += 1
+                remaining[k] += value
+
+    now = time.perf_counter()
+    if enumerate_all(now + max(0, deadline - now) / 2):
+        result = (tuple(cells), table)
+        EXACT_TABLES[constraints] = result
+        if len(EXACT_TABLES) > EXACT_TABLES_SIZE:
+            del EXACT_TABLES[next(iter(EXACT_TABLES))]
+        return result
+
+    # Too many configurations to count in time: estimate them
+    remaining[:] = [count for mask, count in constraints]
+    unassigned[:] = [mask.bit_count() for mask, count in constraints]
+    table.clear()
+    drawn = 0
+    while drawn < samples:
+        drawn += 1
+        sample()
+        if table and time.perf_counter() > deadline:
+            break
+    for entry in table.values():
+        entry[0] /= drawn
+        entry[1] = [count / drawn for count in entry[1]]
+    return tuple(cells), table
+
+
+@functools.lru_cache(maxsize=1024)
+def linear_deductions(constraints):
+    """
+    Returns a pair of bitmasks (safes, mines) of the cells that
+    `constraints`, a tuple of (mask, count) pairs, show to be safe or
+    mines when combined by Gaussian elimination.
+
+    Each constraint is a row of a 0/1 matrix over the cells, reduced
+    with integer row operations; every reduced row is then checked for
+    cells whose value is forced by the bounds the other cells allow.
+    """
+    # Reduced rows as (coefficients by bit number, total), the row each
+    # pivot column belongs to, and the rows using each column
+    rows = []
+    pivots = dict()
+    users = defaultdict(set)
+
+    def combine(row, pivot_row, column):
+        coefficients, total = row
+        pivot_coefficients, pivot_total = pivot_row
+        a, b = pivot_coefficients[column], coefficients[column]
+        combined = {
+            index: a * coefficients.get(index, 0) - b * value
+            for index, value in pivot_coefficients.items()
+        }
+        for index, value in coefficients.items():
+            if index not in combined:
+                combined[index] = a * value
+        combined = {
+            index: value for index, value in combined.items() if value
+        }
+        total = a * total - b * pivot_total
+        divisor = math.gcd(total, *combined.values())
+        if divisor > 1:
+            combined = {
+                index: value // divisor for index, value in combined.items()
+            }
+            total //= divisor
+        return combined, total
+
+    for mask, count in constraints:
+        row = (dict.fromkeys(mask_indices(mask), 1), count)
+        for column in [index for index in row[0] if index in pivots]:
+            row = combine(row, rows[pivots[column]], column)
+        if not row[0]:
+            continue
+
+        # Make the new pivot column zero in every other row
+        column = min(row[0])
+        if row[0][column] < 0:
+            row = ({index: -value for index, value in row[0].items()},
+                   -row[1])
+        for k in list(users[column]):
+            old = rows[k][0]
+            rows[k] = combine(rows[k], row, column)
+            for index in old.keys() - rows[k][0].keys():
+                users[index].discard(k)
+            for index in rows[k][0].keys() - old.keys():
+                users[index].add(k)
+        pivots[column] = len(rows)
+        for index in row[0]:
+            users[index].add(len(rows))
+        rows.append(row)
+
+    safes = 0
+    mines = 0
+    for coefficients, total in rows:
+        highest = sum(value for value in coefficients.values() if value > 0)
+        lowest = sum(value for value in coefficients.values() if value < 0)
+        for index, value in coefficients.items():
+
+            # Range of totals the other cells allow
+            other_highest = highest - max(value, 0)
+            other_lowest = lowest - min(value, 0)
+            if not other_lowest + value <= total <= other_highest + value:
+                safes |= 1 << index
+            elif not other_lowest <= total <= other_highest:
+                mines |= 1 << index
+    return safes, mines
+
+
+def convolve(first, second):
+    """
+    Combines two dicts mapping mine counts to weights into the
+    distribution of their sum.
+    """
+    result = defaultdict(int)
+    for k1, weight1 in first.items():
+        for k2, weight2 in second.items():
+            result[k1 + k2] += weight1 * weight2
+    return result
+
+
+def safe_zone(height, width, cell):
+    """
+    Returns the set of bit numbers of `cell` and its neighbours.
+    """
+    i, j = cell
+    return {
+        k * width + l
+        for k in range(max(i - 1, 0), min(i + 2, height))
+        for l in range(max(j - 1, 0), min(j + 2, width))
+    }
+
+
+def generate_boards(count, height=8, width=8, mines=8, seed=None, safe=None,
+                    chunk=1024):
+    """
+    Returns `count` random boards as a uint8 NumPy array of shape
+    (count, ceil(height * width / 8)), each row holding one board's mine
+    grid packed one bit per cell (little-endian bit order, cell (i, j) at
+    bit i * width + j). `safe` works as in `Minesweeper`. `seed` seeds a
+    NumPy generator, so the boards do not match those `Minesweeper` lays
+    out with the same seed. Boards are drawn `chunk` at a time to bound
+    memory.
+    """
+    rng = np.random.default_rng(seed)
+    cells = height * width
+    excluded = []
+    if safe is not None:
+        excluded = sorted(safe_zone(height, width, safe))
+        if cells - len(excluded) < mines:
+            excluded = [safe[0] * width + safe[1]]
+    if mines > cells - len(excluded):
+        raise ValueError("Too many mines for the board")
+
+    boards = np.zeros((count, (cells + 7) // 8), dtype=np.uint8)
+    for start in range(0, count, chunk):
+        size = min(chunk, count - start)
+
+        # The `mines` cells with the smallest random keys get mines
+        keys = rng.random((size, cells))
+        keys[:, excluded] = 2
+        grid = np.zeros((size, cells), dtype=bool)
+        if mines:
+            chosen = np.argpartition(keys, mines - 1, axis=1)[:, :mines]
+            np.put_along_axis(grid, chosen, True, axis=1)
+        boards[start:start + size] = np.packbits(
+            grid, axis=1, bitorder="little")
+    return boards
 
 
 class Minesweeper():
@@ -8,32 +376,78 @@ class Minesweeper():
     Minesweeper game representation
     """
 
-    def __init__(self, height=8, width=8, mines=8):
+    def __init__(self, height=8, width=8, mines=8, seed=None, safe=None):
+        """
+        Create a board with `mines` mines placed at random, using a
+        generator seeded with `seed` if given (otherwise the `random`
+        module). If `safe` is a cell, no mine is placed on it or, when
+        there is room, next to it, so it can be the first click.
+        """
 
         # Set initial width, height, and number of mines
         self.height = height
         self.width = width
-        self.mines = set()
 
-        # Initialize an empty field with no mines
-        self.board = []
-        for i in range(self.height):
-            row = []
-            for j in range(self.width):
-                row.append(False)
-            self.board.append(row)
+        # Pick mine positions without repeats among the allowed cells
+        rng = random if seed is None else random.Random(seed)
+        cells = range(height * width)
+        if safe is not None:
+            excluded = safe_zone(height, width, safe)
+            if height * width - len(excluded) < mines:
+                excluded = {safe[0] * width + safe[1]}
+            cells = [index for index in cells if index not in excluded]
+        if mines > len(cells):
+            raise ValueError("Too many mines for the board")
+        grid = np.zeros(height * width, dtype=bool)
+        grid[rng.sample(cells, mines)] = True
+        self.place(grid.reshape(height, width))
 
-        # Add mines randomly
-        while len(self.mines) != mines:
-            i = random.randrange(height)
-            j = random.randrange(width)
-            if not self.board[i][j]:
-                self.mines.add((i, j))
-                self.board[i][j] = True
+    @classmethod
+    def from_packed(cls, packed, height, width):
+        """
+        Minesweeper.from_packed(packed, height, width) creates a game from
+        one row of the array returned by `generate_boards`.
+        """
+        game = cls.__new__(cls)
+        game.height = height
+        game.width = width
+        game.place(np.unpackbits(
+            packed, count=height * width, bitorder="little"
+        ).reshape(height, width).astype(bool))
+        return game
+
+    def place(self, grid):
+        """
+        Sets the mines to the True cells of the boolean array `grid`.
+        """
+        self.grid = grid
+        self.mine_mask = int.from_bytes(
+            np.packbits(grid, bitorder="little").tobytes(), "little")
+
+        # Count every cell's neighbouring mines up front
+        self.counts = neighbor_counts(self.grid)
 
         # At first, player has found no mines
         self.mines_found = set()
 
+    @property
+    def mines(self):
+        """
+        Set of (i, j) cells holding mines.
+        """
+        return mask_cells(self.mine_mask, self.width)
+
+    @property
+    def board(self):
+        """
+        Nested lists of booleans, True where a cell holds a mine.
+        """
+        return [
+            [bool(self.mine_mask >> (i * self.width + j) & 1)
+             for j in range(self.width)]
+            for i in range(self.height)
+        ]
+
     def print(self):
         """
         Prints a text-based representation
@@ -42,7 +456,7 @@ class Minesweeper():
         for i in range(self.height):
             print("--" * self.width + "-")
             for j in range(self.width):
-                if self.board[i][j]:
+                if self.is_mine((i, j)):
                     print("|X", end="")
                 else:
                     print("| ", end="")
@@ -51,7 +465,7 @@ class Minesweeper():
 
     def is_mine(self, cell):
         i, j = cell
-        return self.board[i][j]
+        return bool(self.mine_mask >> (i * self.width + j) & 1)
 
     def nearby_mines(self, cell):
         """
@@ -59,24 +473,39 @@ class Minesweeper():
         within one row and column of a given cell,
         not including the cell itself.
         """
+        i, j = cell
+        return int(self.counts[i, j])
 
-        # Keep count of nearby mines
-        count = 0
-
-        # Loop over all cells within one row and column
-        for i in range(cell[0] - 1, cell[0] + 2):
-            for j in range(cell[1] - 1, cell[1] + 2):
-
-                # Ignore the cell itself
-                if (i, j) == cell:
-                    continue
-
-                # Update count if cell in bounds and is mine
-                if 0 <= i < self.height and 0 <= j < self.width:
-                    if self.board[i][j]:
-                        count += 1
+    def reveal_many(self, cells):
+        """
+        Returns a NumPy array holding the number of nearby mines for each
+        cell in `cells`, in order, with -1 for cells that are mines.
+        """
+        if not len(cells):
+            return np.zeros(0, dtype=np.int8)
+        rows, cols = np.asarray(cells).T
+        counts = self.counts[rows, cols]
+        return np.where(self.grid[rows, cols], -1, counts)
 
-        return count
+    def reveal(self, cell):
+        """
+        Returns a dict mapping each cell revealed by clicking `cell`
+        to its number of nearby mines: the cell itself and, when it has
+        no nearby mines, the whole surrounding region of such cells and
+        their borders. `cell` must not be a mine.
+        """
+        revealed = {cell: self.nearby_mines(cell)}
+        frontier = deque([cell])
+        while frontier:
+            i, j = frontier.popleft()
+            if revealed[i, j]:
+                continue
+            for k in range(max(i - 1, 0), min(i + 2, self.height)):
+                for l in range(max(j - 1, 0), min(j + 2, self.width)):
+                    if (k, l) not in revealed:
+                        revealed[k, l] = int(self.counts[k, l])
+                        frontier.append((k, l))
+        return revealed
 
     def won(self):
         """
@@ -90,43 +519,114 @@ class Sentence():
     Logical statement about a Minesweeper game
     A sentence consists of a set of board cells,
     and a count of the number of those cells which are mines.
+
+    Cells are held as a bitmask for a board `width` cells wide. If no
+    width is given, the narrowest width holding every cell is used.
     """
 
-    def __init__(self, cells, count):
-        self.cells = set(cells)
+    __slots__ = ("width", "mask", "count")
+
+    def __init__(self, cells, count, width=None):
+        cells = set(cells)
+        if width is None:
+            width = max((j + 1 for _, j in cells), default=1)
+        elif any(not 0 <= j < width for _, j in cells):
+            raise ValueError(f"Cell outside a board {width} cells wide")
+        self.width = width
+        self.mask = cells_mask(cells, width)
         self.count = count
 
+    @classmethod
+    def from_mask(cls, mask, count, width):
+        """
+        Sentence.from_mask(mask, count, width) builds a sentence
+        directly from a bitmask of cells.
+        """
+        sentence = cls((), count, width)
+        sentence.mask = mask
+        return sentence
+
+    @property
+    def cells(self):
+        """
+        Frozen set of (i, j) cells in the sentence; use `mark_mine` and
+        `mark_safe` to change it.
+        """
+        return frozenset(mask_cells(self.mask, self.width))
+
     def __eq__(self, other):
-        return self.cells == other.cells and self.count == other.count
+        if self.width != other.width:
+            return self.cells == other.cells and self.count == other.count
+        return self.mask == other.mask and self.count == other.count
 
     def __str__(self):
         return f"{self.cells} = {self.count}"
 
+    def key(self):
+        """
+        Returns a hashable key identifying the sentence's current contents.
+        """
+        return self.mask, self.count
+
+    def resolution(self):
+        """
+        Returns a pair of bitmasks (safes, mines) of the cells the
+        sentence settles on its own, assuming none of its cells are
+        already known: all of them are safe if the count is 0, and all
+        are mines if the count equals the number of cells.
+        """
+        if self.count == 0:
+            return self.mask, 0
+        if self.count == self.mask.bit_count():
+            return 0, self.mask
+        return 0, 0
+
+    def known_mines_mask(self, safe_mask):
+        """
+        Returns the bitmask of cells in the sentence known to be mines,
+        given a bitmask of cells known to be safe.
+        """
+        unknown = self.mask & ~safe_mask
+        if self.count == unknown.bit_count():
+            return unknown
+        return 0
+
+    def known_safes_mask(self, mine_mask):
+        """
+        Returns the bitmask of cells in the sentence known to be safe,
+        given a bitmask of cells known to be mines.
+        """
+        mines = self.mask & mine_mask
+        if self.count == mines.bit_count():
+            return self.mask & ~mines
+        return 0
+
     def known_mines(self, safes):
         """
         Returns the set of all cells in self.cells known to be mines.
         """
-        safes_in_sentence = safes.intersection(self.cells)
-        if self.count == len(self.cells) - len(safes_in_sentence):
-            return self.cells.difference(safes_in_sentence)
-        return set()
+        safe_mask = cells_mask(
+            (cell for cell in self.cells if cell in safes), self.width)
+        return mask_cells(self.known_mines_mask(safe_mask), self.width)
 
     def known_safes(self, mines):
         """
         Returns the set of all cells in self.cells known to be safe.
         """
-        mines_in_sentence = mines.intersection(self.cells)
-        if self.count == len(mines_in_sentence):
-            return self.cells.difference(mines_in_sentence)
-        return set()
+        mine_mask = cells_mask(
+            (cell for cell in self.cells if cell in mines), self.width)
+        return mask_cells(self.known_safes_mask(mine_mask), self.width)
 
     def mark_mine(self, cell):
         """
         Updates internal knowledge representation given the fact that
         a cell is known to be a mine.
         """
-        if cell in self.cells:
-            self.cells.remove(cell)
+        if not 0 <= cell[1] < self.width:
+            return
+        bit = 1 << (cell[0] * self.width + cell[1])
+        if self.mask & bit:
+            self.mask ^= bit
             self.count -= 1
 
     def mark_safe(self, cell):
@@ -134,8 +634,8 @@ class Sentence():
         Updates internal knowledge representation given the fact that
         a cell is known to be safe.
         """
-        if cell in self.cells:
-            self.cells.remove(cell)
+        if 0 <= cell[1] < self.width:
+            self.mask &= ~(1 << (cell[0] * self.width + cell[1]))
 
 
 class MinesweeperAI():
@@ -143,64 +643,297 @@ class MinesweeperAI():
     Minesweeper game player
     """
 
-    def __init__(self, height=8, width=8):
+    # How far from changed sentences linear inference looks for others
+    # to combine with them
+    LINEAR_HOPS = 2
+
+    def __init__(self, height=8, width=8, mines=None, probabilistic=True,
+                 time_budget=0.5, samples=2000, inference="subset",
+                 max_sentences=None):
 
-        # Set initial height and width
+        # Set initial height and width, and the number of mines if known
         self.height = height
         self.width = width
+        self.total_mines = mines
+
+        # Combine sentences pairwise by subset inference ("subset"), or
+        # all at once by Gaussian elimination ("linear")
+        if inference not in ("subset", "linear"):
+            raise ValueError(f"Unknown inference mode: {inference}")
+        self.inference = inference
+
+        # When no safe move is known, pick the cell least likely to be a
+        # mine, spending about `time_budget` seconds per guess on frontier
+        # components, whose configurations are enumerated or, if that
+        # takes too long, estimated from up to `samples` random ones
+        self.probabilistic = probabilistic
+        self.time_budget = time_budget
+        self.samples = samples
 
         # Keep track of which cells have been clicked on
-        self.moves_made = set()
+        self.moves_mask = 0
 
         # Keep track of cells known to be safe or mines
-        self.mines = set()
-        self.safes = set()
+        self.mine_mask = 0
+        self.safe_mask = 0
+
+        # Sentences about the game known to be true, keyed by sentence id,
+        # and the id of the sentence holding each distinct (cells, count)
+        self._sentences = dict()
+        self.keys = dict()
+        self.next_id = 0
+
+        # Ids of sentences inferred rather than observed; these are the
+        # first to go when there are more than `max_sentences` sentences
+        self.derived = set()
+        self.max_sentences = max_sentences
 
-        # List of sentences about the game known to be true
-        self.knowledge = []
+        # Ids of the sentences mentioning each cell, by bit number
+        self.index = defaultdict(set)
+
+        # Ids of sentences that changed since they were last examined
+        self.dirty = set()
+
+    @property
+    def moves_made(self):
+        """
+        Set of (i, j) cells that have been clicked on.
+        """
+        return mask_cells(self.moves_mask, self.width)
+
+    @property
+    def mines(self):
+        """
+        Set of (i, j) cells known to be mines.
+        """
+        return mask_cells(self.mine_mask, self.width)
+
+    @property
+    def safes(self):
+        """
+        Set of (i, j) cells known to be safe.
+        """
+        return mask_cells(self.safe_mask, self.width)
+
+    @property
+    def knowledge(self):
+        """
+        List of sentences about the game known to be true.
+        """
+        return list(self._sentences.values())
+
+    def add_sentence(self, sentence, derived=False):
+        """
+        Adds a sentence to the knowledge base and the cell index,
+        and queues it to be examined. Returns the new sentence id,
+        or None if the same sentence is already known.
+        """
+        key = sentence.key()
+        if key in self.keys:
+            return None
+        sentence_id = self.next_id
+        self.next_id += 1
+        self._sentences[sentence_id] = sentence
+        if derived:
+            self.derived.add(sentence_id)
+        self.keys[key] = sentence_id
+        for index in mask_indices(sentence.mask):
+            self.index[index].add(sentence_id)
+        self.dirty.add(sentence_id)
+        return sentence_id
+
+    def remove_sentence(self, sentence_id):
+        """
+        Removes a sentence from the knowledge base and the cell index.
+        """
+        sentence = self._sentences.pop(sentence_id)
+        key = sentence.key()
+        if self.keys.get(key) == sentence_id:
+            del self.keys[key]
+        for index in mask_indices(sentence.mask):
+            self.index[index].discard(sentence_id)
+            if not self.index[index]:
+                del self.index[index]
+        self.dirty.discard(sentence_id)
+        self.derived.discard(sentence_id)
+
+    def sentence_changed(self, sentence_id):
+        """
+        Requeues a sentence after one of its cells was marked, dropping it
+        if it became empty or a duplicate of another sentence.
+        """
+        sentence = self._sentences[sentence_id]
+        key = sentence.key()
+        if not sentence.mask or key in self.keys:
+            self.remove_sentence(sentence_id)
+        else:
+            self.keys[key] = sentence_id
+            self.dirty.add(sentence_id)
 
     def mark_mine(self, cell):
         """
         Marks a cell as a mine, and updates all knowledge
         to mark that cell as a mine as well.
         """
-        self.mines.add(cell)
-        for sentence in self.knowledge:
-            sentence.mark_mine(cell)
-            # delete if empty
-            if not sentence.cells:
-                self.knowledge.remove(sentence)
+        self.mark(cell[0] * self.width + cell[1], mine=True)
 
     def mark_safe(self, cell):
         """
         Marks a cell as safe, and updates all knowledge
         to mark that cell as safe as well.
         """
-        self.safes.add(cell)
-        for sentence in self.knowledge:
-            sentence.mark_safe(cell)
-            # delete if empty
-            if not sentence.cells:
-                self.knowledge.remove(sentence)
-
-    def infer_new_sentence(self):
-        """
-        Adds new sentences to the knowledge base based on the concept of subset inference.
-        """
-        for sentence in self.knowledge:
-            knowledge_without_sentence = copy.deepcopy(self.knowledge)
-            knowledge_without_sentence.remove(sentence)
-            for other_sentence in knowledge_without_sentence:
-                if other_sentence.cells.issubset(sentence.cells):
-                    new_cells = sentence.cells.difference(other_sentence.cells)
-                    new_count = sentence.count - other_sentence.count
-                    new_sentence = Sentence(new_cells, new_count)
-                    # Avoid duplicate sentences
-                    if new_sentence not in self.knowledge:
-                        self.knowledge.append(new_sentence)
-                        return True
+        self.mark(cell[0] * self.width + cell[1], mine=False)
+
+    def mark(self, index, mine):
+        """
+        Marks the cell with bit number `index` as a mine or as safe,
+        updating only the sentences that mention it.
+        """
+        bit = 1 << index
+        if mine:
+            self.mine_mask |= bit
+        else:
+            self.safe_mask |= bit
+        for sentence_id in self.index.pop(index, ()):
+            sentence = self._sentences[sentence_id]
+            del self.keys[sentence.key()]
+            sentence.mask ^= bit
+            if mine:
+                sentence.count -= 1
+            self.sentence_changed(sentence_id)
+
+    def infer(self):
+        """
+        Examines changed sentences until none are left, marking cells
+        they show to be safe or mines and, in subset mode, adding
+        sentences inferred by subset inference against sentences sharing
+        a cell with them. In linear mode, Gaussian elimination over each
+        group of connected sentences is then repeated until it finds no
+        more safes or mines.
+        """
+        while True:
+            examined = set()
+            while self.dirty:
+                sentence_id = self.dirty.pop()
+                examined.add(sentence_id)
+                safes, mines = self._sentences[sentence_id].resolution()
+                if safes or mines:
+                    self.mark_masks(safes, mines)
+                elif self.inference == "subset":
+                    self.infer_from(sentence_id)
+
+            if self.inference != "linear":
+                return
+
+            # Only sentences near a changed one can give anything new
+            nearby = self.nearby_sentences(
+                examined & self._sentences.keys(), self.LINEAR_HOPS)
+            safes, mines = linear_deductions(tuple(sorted(
+                self._sentences[sentence_id].key() for sentence_id in nearby
+            )))
+            if not safes and not mines:
+                return
+            self.mark_masks(safes, mines)
+
+    def nearby_sentences(self, starts, hops):
+        """
+        Returns the ids of the sentences reachable from the sentence ids
+        `starts` by following shared cells at most `hops` times.
+        """
+        nearby = set(starts)
+        frontier = nearby
+        for _ in range(hops):
+            reached = set()
+            for sentence_id in frontier:
+                for index in mask_indices(self._sentences[sentence_id].mask):
+                    reached.update(self.index[index])
+            frontier = reached - nearby
+            nearby |= frontier
+        return nearby
+
+    def mark_masks(self, safes, mines):
+        """
+        Marks every cell in the bitmask `safes` as safe and every cell in
+        the bitmask `mines` as a mine.
+        """
+        for index in mask_indices(safes):
+            self.mark(index, mine=False)
+        for index in mask_indices(mines):
+            self.mark(index, mine=True)
+
+    def infer_from(self, sentence_id):
+        """
+        Adds the sentences that follow from subset inference between the
+        given sentence and every sentence sharing a cell with it.
+        """
+        sentence = self._sentences[sentence_id]
+        others = set()
+        for index in mask_indices(sentence.mask):
+            others.update(self.index[index])
+        others.discard(sentence_id)
+
+        for other_id in others:
+            other = self._sentences[other_id]
+            if not other.mask & ~sentence.mask:
+                self.add_sentence(Sentence.from_mask(
+                    sentence.mask & ~other.mask,
+                    sentence.count - other.count, self.width
+                ), derived=True)
+            elif not sentence.mask & ~other.mask:
+                self.add_sentence(Sentence.from_mask(
+                    other.mask & ~sentence.mask,
+                    other.count - sentence.count, self.width
+                ), derived=True)
+
+    def subsumed(self, sentence_id):
+        """
+        Returns True if the sentence follows from two others: one it
+        contains, A, and one made of the rest of its cells, B - A.
+        """
+        sentence = self._sentences[sentence_id]
+        others = set()
+        for index in mask_indices(sentence.mask):
+            others.update(self.index[index])
+        others.discard(sentence_id)
+        for other_id in others:
+            other = self._sentences[other_id]
+            if not other.mask & ~sentence.mask:
+                rest = (sentence.mask & ~other.mask,
+                        sentence.count - other.count)
+                if rest in self.keys:
+                    return True
         return False
 
+    def compact(self):
+        """
+        Drops sentences until there are no more than `max_sentences`:
+        first those that follow from others, then the oldest inferred
+        ones, then the oldest observed ones.
+
+        Only the first kind loses nothing; subset inference can still
+        miss some deductions without them, so none are dropped below the
+        cap.
+        """
+        excess = len(self._sentences) - self.max_sentences
+        if excess <= 0:
+            return
+        for sentence_id in list(self._sentences):
+            if self.subsumed(sentence_id):
+                self.remove_sentence(sentence_id)
+                excess -= 1
+                if not excess:
+                    return
+        derived = [
+            sentence_id for sentence_id in self._sentences
+            if sentence_id in self.derived
+        ]
+        observed = [
+            sentence_id for sentence_id in self._sentences
+            if sentence_id not in self.derived
+        ]
+        for sentence_id in (derived + observed)[:excess]:
+            self.remove_sentence(sentence_id)
+
     def add_knowledge(self, cell, count):
         """
         Called when the Minesweeper board tells us, for a given
@@ -210,45 +943,25 @@ class MinesweeperAI():
             4) mark any additional cells as safe or as mines
                if it can be concluded based on the AI's knowledge base
         """
+        index = cell[0] * self.width + cell[1]
+
         # mark the cell as a move that has been made
-        self.moves_made.add(cell)
+        self.moves_mask |= 1 << index
         # mark the cell as safe
-        self.mark_safe(cell)
-
-        # add a new sentence to the AI's knowledge base based on the value of `cell` and `count`
-        new_sentence_cells = set()
-        for i in range(cell[0] - 1, cell[0] + 2):
-            for j in range(cell[1] - 1, cell[1] + 2):
-
-                # Ignore the cell itself
-                if (i, j) == cell:
-                    continue
-
-                # add neighbouring cell if in bounds and not in mines nor safes
-                if 0 <= i < self.height and 0 <= j < self.width and (i, j) not in self.safes and (i, j) not in self.mines:
-                    new_sentence_cells.add((i, j))
-
-        if new_sentence_cells:
-            new_sentence = Sentence(new_sentence_cells, count)
-            self.knowledge.append(new_sentence)
-
-        new_mines_or_safes = True
-        new_inference = True
+        self.mark(index, mine=False)
 
-        while new_mines_or_safes or new_inference:
+        # add a new sentence about the neighbouring cells not yet known to be safe or mines;
+        # known mines lower the count
+        neighbors = neighbor_masks(self.height, self.width)[index]
+        count -= (neighbors & self.mine_mask).bit_count()
+        unknown = neighbors & ~self.safe_mask & ~self.mine_mask
+        if unknown:
+            self.add_sentence(Sentence.from_mask(unknown, count, self.width))
 
-            new_mines_or_safes = False
-
-            for sentence in self.knowledge:
-                for safe_cell in sentence.known_safes(self.mines):
-                    new_mines_or_safes = True
-                    self.mark_safe(safe_cell)
-
-                for mine_cell in sentence.known_mines(self.safes):
-                    new_mines_or_safes = True
-                    self.mark_mine(mine_cell)
-
-            new_inference = self.infer_new_sentence()
+        # only sentences touched by a change are examined again
+        self.infer()
+        if self.max_sentences is not None:
+            self.compact()
 
     def make_safe_move(self):
         """
@@ -259,8 +972,10 @@ class MinesweeperAI():
         This function may use the knowledge in self.mines, self.safes
         and self.moves_made, but should not modify any of those values.
         """
-        if len(self.safes) > len(self.moves_made):
-            return random.choice(tuple(self.safes.difference(self.moves_made)))
+        candidates = self.safe_mask & ~self.moves_mask
+        if candidates:
+            return divmod(
+                random.choice(list(mask_indices(candidates))), self.width)
 
         return None
 
@@ -271,12 +986,148 @@ class MinesweeperAI():
             1) have not already been chosen, and
             2) are not known to be mines
         """
-        left_over_cells = []
-        for i in range(self.height):
-            for j in range(self.width):
-                cell = (i, j)
-                if cell not in self.mines and cell not in self.moves_made:
-                    left_over_cells.append(cell)
-        if not left_over_cells:
+        board = (1 << (self.height * self.width)) - 1
+        candidates = board & ~self.mine_mask & ~self.moves_mask
+        if not candidates:
             return None
-        return random.choice(tuple(left_over_cells))
+        if not self.probabilistic:
+            return divmod(
+                random.choice(list(mask_indices(candidates))), self.width)
+
+        # Cells known to be safe cannot be mines; these are the only
+        # candidates left without a probability
+        safes = candidates & self.safe_mask
+        if safes:
+            return divmod(
+                random.choice(list(mask_indices(safes))), self.width)
+
+        # Prefer the cells least likely to be mines
+        probabilities = self.mine_probabilities()
+        lowest = min(probabilities.values())
+        return random.choice([
+            cell for cell, probability in probabilities.items()
+            if probability <= lowest + 1e-9
+        ])
+
+    def frontier_components(self, starts=None):
+        """
+        Splits the knowledge base into groups of sentences connected by
+        shared cells, returning a list of sorted tuples of (mask, count).
+        If `starts` is given, only the groups containing those sentence
+        ids are returned.
+        """
+        components = []
+        seen = set()
+        for start in self._sentences if starts is None else starts:
+            if start in seen:
+                continue
+            seen.add(start)
+            frontier = [start]
+            component = []
+            while frontier:
+                sentence = self._sentences[frontier.pop()]
+                component.append(sentence.key())
+                for index in mask_indices(sentence.mask):
+                    for other_id in self.index[index]:
+                        if other_id not in seen:
+                            seen.add(other_id)
+                            frontier.append(other_id)
+            components.append(tuple(sorted(component)))
+        return components
+
+    def mine_probabilities(self, deadline=None):
+        """
+        Returns a dict mapping each cell not yet known to be safe or a
+        mine to the probability that it is a mine, given the knowledge
+        base and, if known, the total number of mines.
+
+        Each independent group of sentences has its consistent mine
+        configurations enumerated separately; the groups and the cells
+        no sentence mentions are then combined, weighting each total
+        number of mines by the ways to place the remaining mines.
+        All groups share one time limit: `deadline`, a time from
+        `time.perf_counter()`, or `time_budget` seconds from now.
+        """
+        if deadline is None:
+            deadline = time.perf_counter() + self.time_budget
+        board = (1 << (self.height * self.width)) - 1
+        unknown = board & ~self.mine_mask & ~self.safe_mask
+        frontier = 0
+        tables = []
+        for constraints in self.frontier_components():
+            cells, table = component_solutions(
+                constraints, deadline, self.samples)
+            if not table:
+                continue
+            tables.append((cells, table))
+            for index in cells:
+                frontier |= 1 << index
+        others = unknown & ~frontier
+        other_count = others.bit_count()
+
+        # Weight of a configuration placing `k` mines on the frontier
+        if self.total_mines is not None:
+            left = self.total_mines - self.mine_mask.bit_count()
+
+            def weight(k):
+                if 0 <= left - k <= other_count:
+                    return math.comb(other_count, left - k)
+                return 0
+
+            def expected_other(k):
+                return Fraction(left - k, other_count)
+        else:
+            odds = DEFAULT_DENSITY / (1 - DEFAULT_DENSITY)
+
+            def weight(k):
+                return odds ** k
+
+            def expected_other(k):
+                return DEFAULT_DENSITY
+
+        # Distributions of frontier mines before and after each component
+        distributions = [
+            {k: entry[0] for k, entry in table.items()}
+            for cells, table in tables
+        ]
+        prefix = [{0: 1}]
+        for distribution in distributions:
+            prefix.append(convolve(prefix[-1], distribution))
+        suffix = [{0: 1}]
+        for distribution in reversed(distributions):
+            suffix.append(convolve(suffix[-1], distribution))
+        suffix.reverse()
+
+        total = sum(
+            count * weight(k) for k, count in prefix[-1].items())
+        if not total:
+            total = 1
+
+        probabilities = dict()
+        for c, (cells, table) in enumerate(tables):
+            rest = convolve(prefix[c], suffix[c + 1])
+            mine_weights = [0] * len(cells)
+            for k, (solutions, mine_counts) in table.items():
+                factor = sum(
+                    count * weight(k + k_rest)
+                    for k_rest, count in rest.items()
+                )
+                for p, mine_count in enumerate(mine_counts):
+                    mine_weights[p] += mine_count * factor
+            for p, index in enumerate(cells):
+                probabilities[divmod(index, self.width)] = float(
+                    mine_weights[p] / total)
+
+        if other_count:
+            expected = sum(
+                count * weight(k) * expected_other(k)
+                for k, count in prefix[-1].items()
+            )
+            for index in mask_indices(others):
+                probabilities[divmod(index, self.width)] = float(
+                    expected / total)
+
+        return {
+            cell: probability for cell, probability in probabilities.items()
+            if not self.moves_mask >> (cell[0] * self.width + cell[1]) & 1
+        }
@@ -0,0 +1,248 @@
+import argparse
+import random
+import struct
+import time
+
+from minesweeper import Minesweeper, MinesweeperAI
+
+# A log file is a sequence of games, each a header followed by one
+# record per move. All numbers are little-endian.
+MAGIC = b"MSLG"
+VERSION = 2
+
+# Magic, version, height, width, mines, board seed, AI seed, flags,
+# AI time budget, AI samples, AI sentence limit (0 for none), moves
+HEADER = struct.Struct("<4sBHHHqqBdIII")
+
+# Cell index (i * width + j), nearby mines (-1 for a mine),
+# decision, seconds the AI spent on the move
+MOVE = struct.Struct("<IbBf")
+
+# Header flags
+SAFE_START = 1
+MINES_KNOWN = 2
+PROBABILISTIC = 4
+LINEAR = 8
+
+# Decisions
+SAFE = 0
+GUESS = 1
+
+
+def seed_ai(ai_seed):
+    """
+    Seeds the random choices of the AI with `ai_seed`, apart from the
+    stream the board is laid out from.
+    """
+    random.seed(f"ai-{ai_seed}")
+
+
+def ai_options(ai):
+    """
+    Returns the options `ai` was made with, as passed to `MinesweeperAI`.
+    """
+    return {
+        "mines": ai.total_mines,
+        "probabilistic": ai.probabilistic,
+        "time_budget": ai.time_budget,
+        "samples": ai.samples,
+        "inference": ai.inference,
+        "max_sentences": ai.max_sentences
+    }
+
+
+class GameLog():
+    """
+    Record of one game: how the board was made, how the AI was made and
+    seeded and, for every move, the cell clicked, what it revealed,
+    whether the AI knew it was safe or guessed, and how long it took.
+    """
+
+    def __init__(self, height, width, mines, seed, safe_start=False,
+                 ai_seed=0, options=None):
+        self.height = height
+        self.width = width
+        self.mines = mines
+        self.seed = seed
+        self.safe_start = safe_start
+        self.ai_seed = ai_seed
+        self.options = ai_options(
+            MinesweeperAI(height=height, width=width, **(options or {})))
+        self.moves = []
+
+    def record(self, cell, count, decision, elapsed):
+        """
+        Adds a move on `cell` that revealed `count` nearby mines, or -1
+        if it hit a mine.
+        """
+        self.moves.append(
+            (cell[0] * self.width + cell[1], count, decision, elapsed))
+
+    def cells(self):
+        """
+        Returns the (i, j) cell of every move, in order.
+        """
+        return [divmod(index, self.width) for index, _, _, _ in self.moves]
+
+    def game(self):
+        """
+        Rebuilds the board the game was played on.
+        """
+        safe = None
+        if self.safe_start and self.moves:
+            safe = divmod(self.moves[0][0], self.width)
+        return Minesweeper(
+            height=self.height, width=self.width, mines=self.mines,
+            seed=self.seed, safe=safe)
+
+    def to_bytes(self):
+        """
+        Returns the game encoded as a header and one record per move.
+        """
+        options = self.options
+        flags = (
+            (SAFE_START if self.safe_start else 0)
+            | (MINES_KNOWN if options["mines"] is not None else 0)
+            | (PROBABILISTIC if options["probabilistic"] else 0)
+            | (LINEAR if options["inference"] == "linear" else 0)
+        )
+        parts = [HEADER.pack(
+            MAGIC, VERSION, self.height, self.width, self.mines,
+            self.seed, self.ai_seed, flags, options["time_budget"],
+            options["samples"], options["max_sentences"] or 0,
+            len(self.moves))]
+        parts.extend(MOVE.pack(*move) for move in self.moves)
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data, offset=0):
+        """
+        GameLog.from_bytes(data, offset) decodes the game starting at
+        `offset` in `data`, returning the log and the offset after it.
+        """
+        magic, version = struct.unpack_from("<4sB", data, offset)
+        if magic != MAGIC:
+            raise ValueError("Not a Minesweeper game log")
+        if version != VERSION:
+            raise ValueError(f"Unsupported game log version: {version}")
+        (_, _, height, width, mines, seed, ai_seed, flags, time_budget,
+         samples, max_sentences, count) = HEADER.unpack_from(data, offset)
+        offset += HEADER.size
+        options = {
+            "mines": mines if flags & MINES_KNOWN else None,
+            "probabilistic": bool(flags & PROBABILISTIC),
+            "time_budget": time_budget,
+            "samples": samples,
+            "inference": "linear" if flags & LINEAR else "subset",
+            "max_sentences": max_sentences or None
+        }
+        log = cls(height, width, mines, seed, bool(flags & SAFE_START),
+                  ai_seed, options)
+        log.moves = list(MOVE.iter_unpack(
+            data[offset:offset + count * MOVE.size]))
+        return log, offset + count * MOVE.size
+
+
+def write_logs(logs, filename):
+    """
+    Writes game logs, or their encoded bytes, to a file.
+    """
+    with open(filename, "wb") as f:
+        for log in logs:
+            f.write(log if isinstance(log, bytes) else log.to_bytes())
+
+
+def read_logs(filename):
+    """
+    Returns the list of game logs stored in a file.
+    """
+    with open(filename, "rb") as f:
+        data = f.read()
+    logs = []
+    offset = 0
+    while offset < len(data):
+        log, offset = GameLog.from_bytes(data, offset)
+        logs.append(log)
+    return logs
+
+
+def replay(log, options=None):
+    """
+    Runs a fresh `MinesweeperAI`, seeded as in the logged game, over
+    its moves without the board: the AI chooses a move as it would
+    have, then is told the logged move and count. `options` update the
+    logged options the AI is made with.
+
+    Returns the seconds spent on each move, and the numbers of the
+    moves where the AI chose a different cell, or the same cell for a
+    different reason, than the log records. Guesses made by sampling
+    within a time budget can differ when the replay runs at another
+    speed.
+    """
+    options = {**log.options, **(options or dict())}
+    ai = MinesweeperAI(height=log.height, width=log.width, **options)
+    seed_ai(log.ai_seed)
+    latencies = []
+    differences = []
+    for number, (index, count, decision, _) in enumerate(log.moves):
+        start = time.perf_counter()
+        move = ai.make_safe_move()
+        chosen = SAFE
+        if move is None:
+            move = ai.make_random_move()
+            chosen = GUESS
+        cell = divmod(index, log.width)
+        if count >= 0:
+            ai.add_knowledge(cell, count)
+        latencies.append(time.perf_counter() - start)
+        if move != cell or chosen != decision:
+            differences.append(number)
+    return latencies, differences
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay logged Minesweeper games through the AI.")
+    parser.add_argument("log", help="file written by simulate.py --log")
+    parser.add_argument("--inference", choices=("subset", "linear"),
+                        default=None,
+                        help="inference mode (default: as logged)")
+    parser.add_argument("--top", type=int, default=10,
+                        help="number of slowest moves to show")
+    args = parser.parse_args()
+
+    options = dict()
+    if args.inference is not None:
+        options["inference"] = args.inference
+
+    logs = read_logs(args.log)
+    moves = []
+    differences = []
+    start = time.perf_counter()
+    for number, log in enumerate(logs):
+        latencies, differing = replay(log, options)
+        for move, latency in zip(log.moves, latencies):
+            moves.append((latency, number, log, move))
+        differences.extend((number, log, move) for move in differing)
+    elapsed = time.perf_counter() - start
+
+    print(f"Games: {len(logs)}")
+    print(f"Moves: {len(moves)}")
+    print(f"Time: {elapsed:.2f}s")
+    print(f"Moves that differ from the log: {len(differences)}")
+    for number, log, move in differences[:args.top]:
+        cell = divmod(log.moves[move][0], log.width)
+        print(f"  game {number} (seed {log.seed}) move {move} {cell}")
+    print("Slowest moves:")
+    moves.sort(key=lambda move: move[0], reverse=True)
+    for latency, number, log, move in moves[:args.top]:
+        cell = divmod(move[0], log.width)
+        kind = "guess" if move[2] == GUESS else "safe"
+        print(
+            f"  game {number} (seed {log.seed}) {kind} {cell}: "
+            f"{1000 * latency:.3f} ms, logged {1000 * move[3]:.3f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
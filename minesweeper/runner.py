@@ -1,6 +1,7 @@
-import pygame
+import os
 import sys
-import time
+
+import pygame
 
 from minesweeper import Minesweeper, MinesweeperAI
 
@@ -13,210 +14,306 @@ BLACK = (0, 0, 0)
 GRAY = (180, 180, 180)
 WHITE = (255, 255, 255)
 
-# Create game
-pygame.init()
-size = width, height = 600, 400
-screen = pygame.display.set_mode(size)
-
-# Fonts
-OPEN_SANS = "assets/fonts/OpenSans-Regular.ttf"
-smallFont = pygame.font.Font(OPEN_SANS, 20)
-mediumFont = pygame.font.Font(OPEN_SANS, 28)
-largeFont = pygame.font.Font(OPEN_SANS, 40)
+# Window size and frame rate cap
+SIZE = 600, 400
+FPS = 30
 
 # Compute board size
 BOARD_PADDING = 20
-board_width = ((2 / 3) * width) - (BOARD_PADDING * 2)
-board_height = height - (BOARD_PADDING * 2)
-cell_size = int(min(board_width / WIDTH, board_height / HEIGHT))
-board_origin = (BOARD_PADDING, BOARD_PADDING)
-
-# Add images
-flag = pygame.image.load("assets/images/flag.png")
-flag = pygame.transform.scale(flag, (cell_size, cell_size))
-mine = pygame.image.load("assets/images/mine.png")
-mine = pygame.transform.scale(mine, (cell_size, cell_size))
-
-# Create game and AI agent
-game = Minesweeper(height=HEIGHT, width=WIDTH, mines=MINES)
-ai = MinesweeperAI(height=HEIGHT, width=WIDTH)
-
-# Keep track of revealed cells, flagged cells, and if a mine was hit
-revealed = set()
-flags = set()
-lost = False
-
-# Show instructions initially
-instructions = True
-
-while True:
-
-    # Check if game quit
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            sys.exit()
-
-    screen.fill(BLACK)
-
-    # Show game instructions
-    if instructions:
-
-        # Title
-        title = largeFont.render("Play Minesweeper", True, WHITE)
-        titleRect = title.get_rect()
-        titleRect.center = ((width / 2), 50)
-        screen.blit(title, titleRect)
-
-        # Rules
-        rules = [
-            "Click a cell to reveal it.",
-            "Right-click a cell to mark it as a mine.",
-            "Mark all mines successfully to win!"
-        ]
-        for i, rule in enumerate(rules):
-            line = smallFont.render(rule, True, WHITE)
-            lineRect = line.get_rect()
-            lineRect.center = ((width / 2), 150 + 30 * i)
-            screen.blit(line, lineRect)
-
-        # Play game button
-        buttonRect = pygame.Rect((width / 4), (3 / 4) * height, width / 2, 50)
-        buttonText = mediumFont.render("Play Game", True, BLACK)
-        buttonTextRect = buttonText.get_rect()
-        buttonTextRect.center = buttonRect.center
-        pygame.draw.rect(screen, WHITE, buttonRect)
-        screen.blit(buttonText, buttonTextRect)
-
-        # Check if play button clicked
-        click, _, _ = pygame.mouse.get_pressed()
-        if click == 1:
-            mouse = pygame.mouse.get_pos()
-            if buttonRect.collidepoint(mouse):
-                instructions = False
-                time.sleep(0.3)
-
-        pygame.display.flip()
-        continue
-
-    # Draw board
-    cells = []
-    for i in range(HEIGHT):
-        row = []
-        for j in range(WIDTH):
-
-            # Draw rectangle for cell
-            rect = pygame.Rect(
-                board_origin[0] + j * cell_size,
-                board_origin[1] + i * cell_size,
-                cell_size, cell_size
-            )
-            pygame.draw.rect(screen, GRAY, rect)
-            pygame.draw.rect(screen, WHITE, rect, 3)
-
-            # Add a mine, flag, or number if needed
-            if game.is_mine((i, j)) and lost:
-                screen.blit(mine, rect)
-            elif (i, j) in flags:
-                screen.blit(flag, rect)
-            elif (i, j) in revealed:
-                neighbors = smallFont.render(
-                    str(game.nearby_mines((i, j))),
-                    True, BLACK
-                )
-                neighborsTextRect = neighbors.get_rect()
-                neighborsTextRect.center = rect.center
-                screen.blit(neighbors, neighborsTextRect)
-
-            row.append(rect)
-        cells.append(row)
-
-    # AI Move button
+
+OPEN_SANS = "assets/fonts/OpenSans-Regular.ttf"
+
+
+class BoardRenderer():
+    """
+    Draws the Minesweeper board, keeping a surface for every kind of cell
+    and only redrawing cells whose state changed since the last frame.
+    """
+
+    def __init__(self, screen, origin, cell_size, font):
+        self.screen = screen
+        self.origin = origin
+        self.cell_size = cell_size
+
+        # Pre-render the blank cell, the images and every number
+        blank = pygame.Surface((cell_size, cell_size))
+        blank.fill(GRAY)
+        pygame.draw.rect(blank, WHITE, blank.get_rect(), 3)
+        self.surfaces = {"hidden": blank}
+        for name in ("flag", "mine"):
+            image = pygame.image.load(f"assets/images/{name}.png")
+            image = pygame.transform.scale(image, (cell_size, cell_size))
+            surface = blank.copy()
+            surface.blit(image, (0, 0))
+            self.surfaces[name] = surface
+        for count in range(9):
+            surface = blank.copy()
+            text = font.render(str(count), True, BLACK)
+            textRect = text.get_rect()
+            textRect.center = surface.get_rect().center
+            surface.blit(text, textRect)
+            self.surfaces[count] = surface
+
+        # State of each cell as currently drawn
+        self.drawn = dict()
+
+    def cell_rect(self, cell):
+        """
+        Returns the screen rectangle of a cell.
+        """
+        i, j = cell
+        return pygame.Rect(
+            self.origin[0] + j * self.cell_size,
+            self.origin[1] + i * self.cell_size,
+            self.cell_size, self.cell_size
+        )
+
+    def cell_at(self, position, height, width):
+        """
+        Returns the cell under a screen position, or None.
+        """
+        j = (position[0] - self.origin[0]) // self.cell_size
+        i = (position[1] - self.origin[1]) // self.cell_size
+        if 0 <= i < height and 0 <= j < width:
+            return (i, j)
+        return None
+
+    def update(self, states):
+        """
+        Draws every cell whose state in `states`, a dict mapping cells
+        to "hidden", "flag", "mine" or a number of nearby mines, differs
+        from what is on screen. Returns the rectangles drawn.
+        """
+        dirty = []
+        for cell, state in states.items():
+            if self.drawn.get(cell) != state:
+                rect = self.cell_rect(cell)
+                self.screen.blit(self.surfaces[state], rect)
+                self.drawn[cell] = state
+                dirty.append(rect)
+        return dirty
+
+    def invalidate(self):
+        """
+        Forgets what is on screen so every cell is drawn again.
+        """
+        self.drawn.clear()
+
+
+def draw_button(screen, rect, label, font):
+    """
+    Draws a white button with a centered label.
+    """
+    pygame.draw.rect(screen, WHITE, rect)
+    text = font.render(label, True, BLACK)
+    textRect = text.get_rect()
+    textRect.center = rect.center
+    screen.blit(text, textRect)
+
+
+def main(max_frames=None):
+    """
+    Runs the game window. Passing --headless on the command line uses
+    SDL's dummy video driver, so the game can run without a display;
+    `max_frames` stops the loop after that many frames.
+    """
+    if "--headless" in sys.argv:
+        os.environ["SDL_VIDEODRIVER"] = "dummy"
+
+    # Create game
+    pygame.init()
+    width, height = SIZE
+    screen = pygame.display.set_mode(SIZE)
+    clock = pygame.time.Clock()
+
+    # Fonts
+    smallFont = pygame.font.Font(OPEN_SANS, 20)
+    mediumFont = pygame.font.Font(OPEN_SANS, 28)
+    largeFont = pygame.font.Font(OPEN_SANS, 40)
+
+    # Compute board size
+    board_width = ((2 / 3) * width) - (BOARD_PADDING * 2)
+    board_height = height - (BOARD_PADDING * 2)
+    cell_size = int(min(board_width / WIDTH, board_height / HEIGHT))
+    board_origin = (BOARD_PADDING, BOARD_PADDING)
+    renderer = BoardRenderer(screen, board_origin, cell_size, smallFont)
+
+    # Buttons
+    playButton = pygame.Rect((width / 4), (3 / 4) * height, width / 2, 50)
     aiButton = pygame.Rect(
         (2 / 3) * width + BOARD_PADDING, (1 / 3) * height - 50,
         (width / 3) - BOARD_PADDING * 2, 50
     )
-    buttonText = mediumFont.render("AI Move", True, BLACK)
-    buttonRect = buttonText.get_rect()
-    buttonRect.center = aiButton.center
-    pygame.draw.rect(screen, WHITE, aiButton)
-    screen.blit(buttonText, buttonRect)
-
-    # Reset button
     resetButton = pygame.Rect(
         (2 / 3) * width + BOARD_PADDING, (1 / 3) * height + 20,
         (width / 3) - BOARD_PADDING * 2, 50
     )
-    buttonText = mediumFont.render("Reset", True, BLACK)
-    buttonRect = buttonText.get_rect()
-    buttonRect.center = resetButton.center
-    pygame.draw.rect(screen, WHITE, resetButton)
-    screen.blit(buttonText, buttonRect)
-
-    # Display text
-    text = "Lost" if lost else "Won" if game.mines == flags else ""
-    text = mediumFont.render(text, True, WHITE)
-    textRect = text.get_rect()
-    textRect.center = ((5 / 6) * width, (2 / 3) * height)
-    screen.blit(text, textRect)
-
-    move = None
+    statusRect = pygame.Rect(
+        (2 / 3) * width, (2 / 3) * height - 30, width / 3, 60)
+
+    # Create game and AI agent
+    game = Minesweeper(height=HEIGHT, width=WIDTH, mines=MINES)
+    ai = MinesweeperAI(height=HEIGHT, width=WIDTH, mines=MINES)
+
+    # Keep track of revealed cells, flagged cells, and if a mine was hit
+    revealed = set()
+    flags = set()
+    lost = False
+
+    # Show instructions initially
+    instructions = True
+    redraw = True
+    status = None
+    frames = 0
+
+    while max_frames is None or frames < max_frames:
+        frames += 1
+        clock.tick(FPS)
+
+        move = None
+        clicks = []
+
+        # Check if game quit, and collect clicks
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                pygame.quit()
+                return
+            if event.type == pygame.MOUSEBUTTONDOWN:
+                clicks.append(event)
+
+        # Show game instructions
+        if instructions:
+            if redraw:
+                screen.fill(BLACK)
+
+                # Title
+                title = largeFont.render("Play Minesweeper", True, WHITE)
+                titleRect = title.get_rect()
+                titleRect.center = ((width / 2), 50)
+                screen.blit(title, titleRect)
+
+                # Rules
+                rules = [
+                    "Click a cell to reveal it.",
+                    "Right-click a cell to mark it as a mine.",
+                    "Mark all mines successfully to win!"
+                ]
+                for i, rule in enumerate(rules):
+                    line = smallFont.render(rule, True, WHITE)
+                    lineRect = line.get_rect()
+                    lineRect.center = ((width / 2), 150 + 30 * i)
+                    screen.blit(line, lineRect)
+
+                # Play game button
+                draw_button(screen, playButton, "Play Game", mediumFont)
+                pygame.display.flip()
+                redraw = False
+
+            # Check if play button clicked
+            for click in clicks:
+                if click.button == 1 and playButton.collidepoint(click.pos):
+                    instructions = False
+                    redraw = True
+            continue
 
-    left, _, right = pygame.mouse.get_pressed()
+        for click in clicks:
+            cell = renderer.cell_at(click.pos, HEIGHT, WIDTH)
 
-    # Check for a right-click to toggle flagging
-    if right == 1 and not lost:
-        mouse = pygame.mouse.get_pos()
+            # Check for a right-click to toggle flagging
+            if click.button == 3 and not lost:
+                if cell is not None and cell not in revealed:
+                    if cell in flags:
+                        flags.remove(cell)
+                    else:
+                        flags.add(cell)
+
+            elif click.button == 1:
+
+                # If AI button clicked, make an AI move
+                if aiButton.collidepoint(click.pos) and not lost:
+                    move = ai.make_safe_move()
+                    if move is None:
+                        move = ai.make_random_move()
+                        if move is None:
+                            flags = ai.mines.copy()
+                            print("No moves left to make.")
+                        else:
+                            print("No known safe moves, AI making random move.")
+                    else:
+                        print("AI making safe move.")
+
+                # Reset game state
+                elif resetButton.collidepoint(click.pos):
+                    game = Minesweeper(height=HEIGHT, width=WIDTH, mines=MINES)
+                    ai = MinesweeperAI(height=HEIGHT, width=WIDTH, mines=MINES)
+                    revealed = set()
+                    flags = set()
+                    lost = False
+                    move = None
+
+                # User-made move
+                elif not lost and cell is not None:
+                    if cell not in flags and cell not in revealed:
+                        move = cell
+
+            # Make move and update AI knowledge
+            if move:
+
+                # Lay mines out around the first move so it is safe
+                if not revealed and not lost:
+                    game = Minesweeper(
+                        height=HEIGHT, width=WIDTH, mines=MINES, safe=move)
+
+                if game.is_mine(move):
+                    lost = True
+                else:
+                    nearby = game.nearby_mines(move)
+                    revealed.add(move)
+                    ai.add_knowledge(move, nearby)
+                move = None
+
+        # Draw the static parts of the screen once
+        dirty = []
+        if redraw:
+            screen.fill(BLACK)
+            draw_button(screen, aiButton, "AI Move", mediumFont)
+            draw_button(screen, resetButton, "Reset", mediumFont)
+            renderer.invalidate()
+            status = None
+            dirty.append(screen.get_rect())
+            redraw = False
+
+        # Redraw cells that changed
+        states = dict()
         for i in range(HEIGHT):
             for j in range(WIDTH):
-                if cells[i][j].collidepoint(mouse) and (i, j) not in revealed:
-                    if (i, j) in flags:
-                        flags.remove((i, j))
-                    else:
-                        flags.add((i, j))
-                    time.sleep(0.2)
-
-    elif left == 1:
-        mouse = pygame.mouse.get_pos()
-
-        # If AI button clicked, make an AI move
-        if aiButton.collidepoint(mouse) and not lost:
-            move = ai.make_safe_move()
-            if move is None:
-                move = ai.make_random_move()
-                if move is None:
-                    flags = ai.mines.copy()
-                    print("No moves left to make.")
+                cell = (i, j)
+                if lost and game.is_mine(cell):
+                    states[cell] = "mine"
+                elif cell in flags:
+                    states[cell] = "flag"
+                elif cell in revealed:
+                    states[cell] = game.nearby_mines(cell)
                 else:
-                    print("No known safe moves, AI making random move.")
-            else:
-                print("AI making safe move.")
-            time.sleep(0.2)
-
-        # Reset game state
-        elif resetButton.collidepoint(mouse):
-            game = Minesweeper(height=HEIGHT, width=WIDTH, mines=MINES)
-            ai = MinesweeperAI(height=HEIGHT, width=WIDTH)
-            revealed = set()
-            flags = set()
-            lost = False
-            continue
+                    states[cell] = "hidden"
+        dirty.extend(renderer.update(states))
+
+        # Display text
+        text = "Lost" if lost else "Won" if game.mines == flags else ""
+        if text != status:
+            screen.fill(BLACK, statusRect)
+            rendered = mediumFont.render(text, True, WHITE)
+            textRect = rendered.get_rect()
+            textRect.center = ((5 / 6) * width, (2 / 3) * height)
+            screen.blit(rendered, textRect)
+            dirty.append(statusRect)
+            status = text
+
+        if dirty:
+            pygame.display.update(dirty)
+
+    pygame.quit()
+
 
-        # User-made move
-        elif not lost:
-            for i in range(HEIGHT):
-                for j in range(WIDTH):
-                    if (cells[i][j].collidepoint(mouse)
-                            and (i, j) not in flags
-                            and (i, j) not in revealed):
-                        move = (i, j)
-
-    # Make move and update AI knowledge
-    if move:
-        if game.is_mine(move):
-            lost = True
-        else:
-            nearby = game.nearby_mines(move)
-            revealed.add(move)
-            ai.add_knowledge(move, nearby)
-
-    pygame.display.flip()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+import argparse
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from minesweeper import Minesweeper, MinesweeperAI
+from replay import GUESS, SAFE, GameLog, seed_ai, write_logs
+
+
+def play_game(height, width, mines, seed, options, safe_start=False,
+              record=False):
+    """
+    Play one game of Minesweeper with the AI, seeding the board and the
+    AI's random choices with `seed` so the same game can be played again.
+    `options` are passed on to `MinesweeperAI`. If `safe_start` is True,
+    the board is laid out after the first move so that it hits no mine
+    and no neighbouring mine.
+
+    Returns a dict with whether the game was won, how many moves
+    were made, and the AI's latency for each move in seconds. If
+    `record` is True, it also holds the encoded `GameLog` under "log".
+    """
+    # Board and AI draw from separate streams, so the AI's first guess
+    # is not the board's first mine
+    seed_ai(seed)
+    game = None
+    if not safe_start:
+        game = Minesweeper(height=height, width=width, mines=mines, seed=seed)
+    ai = MinesweeperAI(height=height, width=width, **options)
+    log = None
+    if record:
+        log = GameLog(height, width, mines, seed, safe_start, seed, options)
+    latencies = []
+    moves = 0
+
+    while moves < height * width - mines:
+
+        # Time the AI choosing a move
+        start = time.perf_counter()
+        move = ai.make_safe_move()
+        decision = SAFE
+        if move is None:
+            move = ai.make_random_move()
+            decision = GUESS
+        elapsed = time.perf_counter() - start
+
+        # Only known mines left
+        if move is None:
+            break
+
+        if game is None:
+            game = Minesweeper(
+                height=height, width=width, mines=mines, seed=seed, safe=move)
+
+        moves += 1
+        if game.is_mine(move):
+            latencies.append(elapsed)
+            if log is not None:
+                log.record(move, -1, decision, elapsed)
+            return result(False, moves, latencies, log)
+
+        # Time the AI taking in what the move revealed
+        count = game.nearby_mines(move)
+        start = time.perf_counter()
+        ai.add_knowledge(move, count)
+        elapsed += time.perf_counter() - start
+        latencies.append(elapsed)
+        if log is not None:
+            log.record(move, count, decision, elapsed)
+
+    return result(True, moves, latencies, log)
+
+
+def result(won, moves, latencies, log):
+    """
+    Returns the dict `play_game` reports a finished game with.
+    """
+    summary = {"won": won, "moves": moves, "latencies": latencies}
+    if log is not None:
+        summary["log"] = log.to_bytes()
+    return summary
+
+
+def percentile(values, fraction):
+    """
+    Return the value below which `fraction` of the sorted list
+    `values` lies, using the nearest rank.
+    """
+    if not values:
+        return 0.0
+    rank = min(len(values) - 1, max(0, round(fraction * len(values)) - 1))
+    return values[rank]
+
+
+def simulate(games, height=8, width=8, mines=8, seed=0, workers=None,
+             options=None, safe_start=False, log=None):
+    """
+    Play `games` games with seeds `seed`, `seed + 1`, ... across
+    `workers` processes (all available CPUs if None, or in this process
+    if 1), and return a summary of the results. `options` are passed on
+    to `MinesweeperAI`. If `log` is a filename, every game's moves are
+    written to it for `replay.py`.
+    """
+    if options is None:
+        options = dict()
+    seeds = range(seed, seed + games)
+    args = (
+        [height] * games, [width] * games, [mines] * games,
+        seeds, [options] * games, [safe_start] * games,
+        [log is not None] * games
+    )
+    start = time.perf_counter()
+    if workers == 1:
+        results = list(map(play_game, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(
+                play_game, *args, chunksize=max(1, games // 64)))
+    elapsed = time.perf_counter() - start
+
+    if log is not None:
+        write_logs((result["log"] for result in results), log)
+
+    latencies = sorted(
+        latency for result in results for latency in result["latencies"])
+    return {
+        "games": games,
+        "win_rate": sum(result["won"] for result in results) / games,
+        "mean_moves": statistics.mean(result["moves"] for result in results),
+        "latency_p50": percentile(latencies, 0.5),
+        "latency_p90": percentile(latencies, 0.9),
+        "latency_p99": percentile(latencies, 0.99),
+        "latency_max": latencies[-1] if latencies else 0.0,
+        "seconds": elapsed
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Play Minesweeper games with the AI, without a display.")
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--height", type=int, default=8)
+    parser.add_argument("--width", type=int, default=8)
+    parser.add_argument("--mines", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of processes (default: all CPUs)")
+    parser.add_argument("--random-guesses", action="store_true",
+                        help="guess uniformly instead of by probability")
+    parser.add_argument("--safe-start", action="store_true",
+                        help="keep mines away from the first move")
+    parser.add_argument("--inference", choices=("subset", "linear"),
+                        default="subset")
+    parser.add_argument("--log", default=None,
+                        help="write every game's moves to this file")
+    args = parser.parse_args()
+
+    summary = simulate(
+        args.games, args.height, args.width, args.mines,
+        seed=args.seed, workers=args.workers, safe_start=args.safe_start,
+        log=args.log,
+        options={
+            "mines": args.mines,
+            "probabilistic": not args.random_guesses,
+            "inference": args.inference
+        }
+    )
+
+    print(f"Games: {summary['games']}")
+    print(f"Win rate: {100 * summary['win_rate']:.2f}%")
+    print(f"Moves per game: {summary['mean_moves']:.1f}")
+    for name in ("p50", "p90", "p99", "max"):
+        latency = 1000 * summary[f"latency_{name}"]
+        print(f"AI latency {name}: {latency:.3f} ms")
+    print(f"Time: {summary['seconds']:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import argparse
+import contextlib
+import io
+import random
+import statistics
+import time
+
+from nim import train, train_batch, train_parallel
+from solver import accuracy
+
+# Piles the trainers start from by default
+INITIAL = [1, 3, 5, 7]
+
+
+def timed(function, *args, **kwargs):
+    """
+    Calls `function`, hiding what it prints, and returns its result
+    and the seconds it took.
+    """
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def games_to_converge(initial, symmetric, target, most, seed):
+    """
+    Returns the fewest games, doubling from 250, after which `train`
+    reaches `target` accuracy from the piles `initial`, or None if it
+    has not within `most` games, along with the Q-table size then.
+    """
+    games = 250
+    while games <= most:
+        random.seed(seed)
+        ai, _ = timed(
+            train, games, initial, symmetric=symmetric, quiet=True)
+        if accuracy(ai, initial) >= target:
+            return games, ai.size()
+        games *= 2
+    return None, ai.size()
+
+
+def compare_symmetry(initial, target, most, trials):
+    """
+    Prints how many games `train` needs to reach `target` accuracy with
+    and without sharing Q-values between reorderings of the same piles.
+    """
+    print(f"Games to {target:.0%} of winnable positions won from {initial}:")
+    for symmetric in (False, True):
+        results = [
+            games_to_converge(initial, symmetric, target, most, seed)
+            for seed in range(trials)
+        ]
+        games = [games for games, _ in results if games is not None]
+        median = f"{statistics.median(games):,.0f}" if games else "-"
+        print(
+            f"  {'symmetric' if symmetric else 'plain'}: "
+            f"median {median} games, "
+            f"{len(games)}/{trials} runs converged, "
+            f"Q-table {statistics.mean(size for _, size in results):,.0f} "
+            f"entries"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the speed of the Nim trainers.")
+    parser.add_argument("--games", type=int, default=100000)
+    parser.add_argument("--sequential-games", type=int, default=10000,
+                        help="games for the one-at-a-time trainer")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of processes (default: all CPUs)")
+    parser.add_argument("--syncs", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--symmetry", type=int, nargs="*", metavar="PILE",
+                        help="instead compare games to converge with and "
+                             "without symmetry, from these piles")
+    parser.add_argument("--target", type=float, default=0.95)
+    parser.add_argument("--trials", type=int, default=5)
+    parser.add_argument("--most", type=int, default=160000,
+                        help="most games to try for convergence")
+    args = parser.parse_args()
+
+    if args.symmetry is not None:
+        compare_symmetry(
+            args.symmetry or INITIAL, args.target, args.most, args.trials)
+        return
+
+    ai, seconds = timed(train, args.sequential_games, quiet=True)
+    print(
+        f"train: {args.sequential_games / seconds:,.0f} games/s, "
+        f"{accuracy(ai, INITIAL):.2%} of winnable positions won"
+    )
+
+    ai, seconds = timed(train_batch, args.games, seed=args.seed)
+    print(
+        f"train_batch: {args.games / seconds:,.0f} games/s, "
+        f"{accuracy(ai, INITIAL):.2%} of winnable positions won"
+    )
+
+    # Let the parallel trainer show how its table settles over time
+    print("train_parallel:")
+    start = time.perf_counter()
+    ai = train_parallel(
+        args.games, workers=args.workers, syncs=args.syncs, seed=args.seed)
+    seconds = time.perf_counter() - start
+    print(
+        f"train_parallel: {args.games / seconds:,.0f} games/s, "
+        f"{accuracy(ai, INITIAL):.2%} of winnable positions won"
+    )
+
+
+if __name__ == "__main__":
+    main()
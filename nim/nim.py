@@ -1,6 +1,15 @@
+import functools
+import json
 import math
+import os
 import random
 import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Most states whose available actions are remembered at once
+ACTION_CACHE_SIZE = 1 << 16
 
 
 class Nim():
@@ -25,12 +34,11 @@ class Nim():
 
         Action `(i, j)` represents the action of removing `j` items
         from pile `i` (where piles are 0-indexed).
+
+        The actions come as a tuple, computed once per state and shared
+        between calls, so it must not be modified.
         """
-        actions = set()
-        for i, pile in enumerate(piles):
-            for j in range(1, pile + 1):
-                actions.add((i, j))
-        return actions
+        return state_actions(tuple(piles))
 
     @classmethod
     def other_player(cls, player):
@@ -70,9 +78,78 @@ class Nim():
             self.winner = self.player
 
 
+@functools.lru_cache(maxsize=ACTION_CACHE_SIZE)
+def state_actions(piles):
+    """
+    Returns the tuple of actions `(i, j)` available with the piles
+    `piles`, a tuple, ordered by pile and then by count.
+    """
+    return tuple(
+        (i, j) for i, pile in enumerate(piles) for j in range(1, pile + 1)
+    )
+
+
+@functools.lru_cache(maxsize=ACTION_CACHE_SIZE)
+def canonical_form(piles):
+    """
+    Returns the pile tuple `piles` sorted in increasing order, and for
+    each position of the sorted piles, the index of the pile it holds.
+    """
+    order = tuple(sorted(range(len(piles)), key=piles.__getitem__))
+    return tuple(piles[k] for k in order), order
+
+
+class StateEncoding():
+    """
+    Numbers every state reachable from the piles `initial` and every
+    action in them with dense integer indices.
+
+    A state's index reads its piles as the digits of a mixed-radix
+    number, pile `k` having `initial[k] + 1` possible values, so the
+    empty board is index 0. Action `(i, j)` has index
+    `offsets[i] + j - 1`.
+    """
+
+    def __init__(self, initial):
+        self.initial = list(initial)
+        self.shape = tuple(pile + 1 for pile in self.initial)
+        self.size = math.prod(self.shape)
+
+        # Place value of each pile, the last pile varying fastest
+        self.places = [
+            math.prod(self.shape[k + 1:]) for k in range(len(self.shape))
+        ]
+
+        # Action (i, j) for every action index
+        self.offsets = []
+        self.actions = []
+        for i, pile in enumerate(self.initial):
+            self.offsets.append(len(self.actions))
+            self.actions.extend((i, j) for j in range(1, pile + 1))
+
+        # Piles of every state, and which actions each state allows
+        self.piles = np.indices(self.shape).reshape(len(self.shape), -1).T
+        self.action_piles = np.array([i for i, _ in self.actions], dtype=int)
+        self.action_counts = np.array([j for _, j in self.actions], dtype=int)
+        self.valid = np.ascontiguousarray(
+            self.piles[:, self.action_piles] >= self.action_counts)
+
+    def state_index(self, state):
+        """
+        Returns the index of a list or tuple of piles.
+        """
+        return sum(pile * place for pile, place in zip(state, self.places))
+
+    def action_index(self, action):
+        """
+        Returns the index of an action `(i, j)`.
+        """
+        return self.offsets[action[0]] + action[1] - 1
+
+
 class NimAI():
 
-    def __init__(self, alpha=0.5, epsilon=0.1):
+    def __init__(self, alpha=0.5, epsilon=0.1, initial=None, symmetric=False):
         """
         Initialize AI with an empty Q-learning dictionary,
         an alpha (learning) rate, and an epsilon rate.
@@ -81,27 +158,129 @@ class NimAI():
         pairs to a Q-value (a number).
          - `state` is a tuple of remaining piles, e.g. (1, 1, 4, 4)
          - `action` is a tuple `(i, j)` for an action
+
+        If the starting piles `initial` are given, Q-values are instead
+        kept in a NumPy array with a row per state and a column per
+        action, numbered by a `StateEncoding`. Actions a state does not
+        allow hold -inf, so a row's maximum is over available actions.
+
+        If `symmetric` is True, states that are reorderings of the same
+        piles share their Q-values: they are stored under the piles
+        sorted in increasing order, with actions renumbered to match.
         """
-        self.q = dict()
         self.alpha = alpha
         self.epsilon = epsilon
+        self.symmetric = symmetric
+        if initial is None:
+            self.encoding = None
+            self.q = dict()
+        else:
+            # Sorted states fit within the sorted starting piles
+            if symmetric:
+                initial = sorted(initial)
+            self.encoding = StateEncoding(initial)
+            self.q = np.where(self.encoding.valid, 0.0, -np.inf)
+
+    def save(self, filename):
+        """
+        Saves the Q-values to a NumPy .npy file as an array with one
+        axis per pile, indexed by its size, and a last axis for actions,
+        so the starting piles can be read back from its shape.
+
+        A Q-learning dictionary is stored as an array for the smallest
+        piles holding every state it has seen, with 0 for pairs it has
+        no Q-values for.
+
+        Whether the AI is symmetric is saved next to the array, in
+        `filename` with ".json" appended.
+        """
+        if self.encoding is not None:
+            encoding = self.encoding
+            q = self.q
+        else:
+            states = [state for state, _ in self.q]
+            if not states:
+                raise ValueError("No Q-values to save")
+            encoding = StateEncoding(map(max, zip(*states)))
+            q = np.where(encoding.valid, 0.0, -np.inf)
+            for (state, action), value in self.q.items():
+                q[encoding.state_index(state),
+                  encoding.action_index(action)] = value
+        # As np.save does, so the flag sits next to the file it wrote
+        filename = os.fspath(filename)
+        if not filename.endswith(".npy"):
+            filename += ".npy"
+        np.save(filename, q.reshape(encoding.shape + (q.shape[1],)))
+        with open(f"{filename}.json", "w") as f:
+            json.dump({"symmetric": self.symmetric}, f)
+
+    @classmethod
+    def load(cls, filename, mmap=True, alpha=0.5, epsilon=0.1,
+             symmetric=None):
+        """
+        NimAI.load(filename) returns an AI with the Q-values saved in
+        `filename`. If `mmap` is True, the file is memory-mapped read-only
+        rather than read, so loading is immediate and processes loading
+        the same file share its pages, but the AI cannot be trained.
+
+        The AI is symmetric if the one that saved the file was. Passing
+        `symmetric` raises ValueError if it does not match; it is only
+        used for files saved without the flag.
+        """
+        saved = None
+        if os.path.exists(f"{filename}.json"):
+            with open(f"{filename}.json") as f:
+                saved = json.load(f)["symmetric"]
+        if saved is None:
+            saved = bool(symmetric)
+        elif symmetric is not None and symmetric != saved:
+            raise ValueError(
+                f"{filename} was saved by an AI with symmetric={saved}")
+        q = np.load(filename, mmap_mode="r" if mmap else None)
+        ai = cls(alpha=alpha, epsilon=epsilon, symmetric=saved)
+        ai.encoding = StateEncoding(size - 1 for size in q.shape[:-1])
+        ai.q = q.reshape(ai.encoding.size, q.shape[-1])
+        return ai
+
+    def canonical(self, state, action=None):
+        """
+        Returns the tuple of piles the state `state` is stored under,
+        the order mapping its positions back to the piles of `state`
+        (None without symmetry), and `action`, if given, as an action in
+        the stored state.
+        """
+        if not self.symmetric:
+            return tuple(state), None, action
+        key, order = canonical_form(tuple(state))
+        if action is not None:
+            action = (order.index(action[0]), action[1])
+        return key, order, action
 
     def update(self, old_state, action, new_state, reward):
         """
         Update Q-learning model, given an old state, an action taken
         in that state, a new resulting state, and the reward received
         from taking that action.
+
+        Returns how much the Q-value changed.
         """
         old = self.get_q_value(old_state, action)
         best_future = self.best_future_reward(new_state)
-        self.update_q_value(old_state, action, old, reward, best_future)
+        new = self.update_q_value(old_state, action, old, reward, best_future)
+        return abs(new - old)
 
     def get_q_value(self, state, action):
         """
         Return the Q-value for the state `state` and the action `action`.
         If no Q-value exists yet in `self.q`, return 0.
         """
-        return self.q.get((tuple(state), action), 0)
+        key, _, action = self.canonical(state, action)
+        if self.encoding is not None:
+            return float(self.q[
+                self.encoding.state_index(key),
+                self.encoding.action_index(action)
+            ])
+        return self.q.get((key, action), 0)
 
     def update_q_value(self, state, action, old_q, reward, future_rewards):
         """
@@ -117,11 +296,30 @@ class NimAI():
         where `old value estimate` is the previous Q-value,
         `alpha` is the learning rate, and `new value estimate`
         is the sum of the current reward and estimated future rewards.
+
+        Returns the new Q-value.
         """
 
         new_q = old_q + self.alpha * \
             ((reward + future_rewards) - old_q)
-        self.q[(tuple(state), action)] = new_q
+        key, _, action = self.canonical(state, action)
+        if self.encoding is not None:
+            self.q[
+                self.encoding.state_index(key),
+                self.encoding.action_index(action)
+            ] = new_q
+        else:
+            self.q[(key, action)] = new_q
+        return new_q
+
+    def size(self):
+        """
+        Returns the number of `(state, action)` pairs with a Q-value,
+        counting only non-zero values for a Q-table array.
+        """
+        if self.encoding is not None:
+            return int(np.count_nonzero(np.isfinite(self.q) & (self.q != 0)))
+        return len(self.q)
 
     def best_future_reward(self, state):
         """
@@ -133,12 +331,17 @@ class NimAI():
         Q-value in `self.q`. If there are no available actions in
         `state`, return 0.
         """
-        available_actions = Nim.available_actions(state)
+        key, _, _ = self.canonical(state)
+        if self.encoding is not None:
+            index = self.encoding.state_index(key)
 
-        if not available_actions:
-            return 0
+            # Only the empty board, index 0, has no available actions
+            return float(self.q[index].max()) if index else 0
 
-        return max([self.get_q_value(state, action) for action in available_actions])
+        return max(
+            (self.q.get((key, action), 0) for action in state_actions(key)),
+            default=0
+        )
 
     def choose_action(self, state, epsilon=True):
         """
@@ -155,33 +358,77 @@ class NimAI():
         If multiple actions have the same Q-value, any of those
         options is an acceptable return value.
         """
-        available_actions = Nim.available_actions(state)
-        epsilon = int(epsilon)
-        best_q, best_action = max([(self.get_q_value(state, action), action)
-                                   for action in available_actions], key=lambda tup: tup[0])
-
-        if not epsilon:
-            return best_action
+        key, order, _ = self.canonical(state)
+        if self.encoding is not None:
+            row = self.q[self.encoding.state_index(key)]
+            best_action = self.encoding.actions[int(row.argmax())]
         else:
-            best_or_random_action = ['random']*epsilon
-            best_or_random_action += ['best']*100
-            if random.choice(best_or_random_action) == 'random':
-                return random.choice(list(available_actions))
-            else:
-                return best_action
+            # Find the best action and its Q-value in one pass
+            best_q = -math.inf
+            for action in state_actions(key):
+                q = self.q.get((key, action), 0)
+                if q > best_q:
+                    best_q, best_action = q, action
+
+        # Map the best action back to the piles of `state`
+        if order is not None:
+            best_action = (order[best_action[0]], best_action[1])
 
+        if epsilon and random.random() < self.epsilon:
+            return random.choice(state_actions(tuple(state)))
+        return best_action
 
-def train(n):
+
+def train(n, initial=[1, 3, 5, 7], dense=False, symmetric=False,
+          report_every=1000, metrics=None, quiet=False):
     """
-    Train an AI by playing `n` games against itself.
+    Train an AI by playing `n` games against itself, starting from the
+    piles `initial`. If `dense` is True, the AI keeps its Q-values in a
+    NumPy array rather than a dictionary, and if `symmetric` is True,
+    reorderings of the same piles share Q-values.
+
+    Every `report_every` games, and after the last one, progress is
+    reported: games per second and mean absolute change of the updated
+    Q-values since the last report, Q-table size and epsilon. Reports
+    are printed unless `quiet` is True, and written as JSON lines to
+    the file `metrics` if given.
     """
 
-    player = NimAI()
+    player = NimAI(initial=initial if dense else None, symmetric=symmetric)
+    output = open(metrics, "w") if metrics is not None else None
+    start = last_report = time.perf_counter()
+    changes = updates = 0
+
+    def report(games):
+        """
+        Reports progress after `games` games and starts a new interval.
+        """
+        nonlocal last_report, changes, updates
+        now = time.perf_counter()
+        record = {
+            "games": games,
+            "seconds": now - start,
+            "games_per_second": (
+                (games - 1) % report_every + 1) / max(now - last_report, 1e-9),
+            "q_size": player.size(),
+            "mean_abs_dq": changes / updates if updates else 0.0,
+            "epsilon": player.epsilon
+        }
+        if not quiet:
+            print(
+                f"Game {games}/{n}: {record['games_per_second']:,.0f} games/s, "
+                f"{record['q_size']} Q-values, "
+                f"mean |dQ| {record['mean_abs_dq']:.4f}, "
+                f"epsilon {record['epsilon']}"
+            )
+        if output is not None:
+            output.write(json.dumps(record) + "\n")
+        last_report = now
+        changes = updates = 0
 
     # Play n games
     for i in range(n):
-        print(f"Playing training game {i + 1}")
-        game = Nim()
+        game = Nim(initial)
 
         # Keep track of last move made by either player
         last = {
@@ -206,27 +453,195 @@ def train(n):
 
             # When game is over, update Q values with rewards
             if game.winner is not None:
-                player.update(state, action, new_state, -1)
-                player.update(
+                changes += player.update(state, action, new_state, -1)
+                changes += player.update(
                     last[game.player]["state"],
                     last[game.player]["action"],
                     new_state,
                     1
                 )
+                updates += 2
                 break
 
             # If game is continuing, no rewards yet
             elif last[game.player]["state"] is not None:
-                player.update(
+                changes += player.update(
                     last[game.player]["state"],
                     last[game.player]["action"],
                     new_state,
                     0
                 )
+                updates += 1
+
+        if (i + 1) % report_every == 0 or i + 1 == n:
+            report(i + 1)
+
+    if output is not None:
+        output.close()
+    if not quiet:
+        print("Done training")
+
+    # Return the trained AI
+    return player
+
+
+def train_batch(n, initial=[1, 3, 5, 7], batch=4096, seed=None):
+    """
+    Train an AI with a Q-table array by playing `n` games against
+    itself, `batch` games at a time in lockstep: each step, every
+    unfinished game of the batch makes a move and the Q-values of all
+    of those moves are updated together. Each move is a random one
+    with probability `epsilon` of the AI, and `seed` seeds that choice.
+    """
+    player = NimAI(initial=initial)
+    play_batches(player, n, initial, batch, np.random.default_rng(seed))
+    print("Done training")
+
+    # Return the trained AI
+    return player
+
+
+def play_batches(player, n, initial, batch, rng):
+    """
+    Plays `n` games of `train_batch` from the piles `initial`, updating
+    the Q-table array of `player` and drawing moves from the NumPy
+    generator `rng`.
+    """
+    encoding = player.encoding
+    q = player.q
+    flat = q.reshape(-1)
+    places = np.array(encoding.places)
+
+    def update(states, actions, new_states, rewards):
+        """
+        Moves the Q-values of the pairs `(states, actions)` towards
+        `rewards` plus the best future reward of `new_states`. A pair
+        appearing more than once is moved once, by its mean change.
+        """
+        future = np.where(
+            new_states == 0, 0, q[new_states].max(axis=1, initial=-np.inf))
+        keys = states * q.shape[1] + actions
+        delta = rewards + future - flat[keys]
+        keys, inverse = np.unique(keys, return_inverse=True)
+        flat[keys] += player.alpha * (
+            np.bincount(inverse, delta) / np.bincount(inverse))
+
+    for start in range(0, n, batch):
+        size = min(batch, n - start)
+        state = np.full(size, encoding.state_index(initial))
+        turn = np.zeros(size, dtype=int)
+
+        # Last state and action of each player in each game, -1 if none
+        last_state = np.full((2, size), -1)
+        last_action = np.full((2, size), -1)
+
+        active = np.arange(size)
+        while active.size:
+            states = state[active]
+
+            # Best actions, replaced by random available ones at times
+            actions = q[states].argmax(axis=1)
+            explore = rng.random(active.size) < player.epsilon
+            if explore.any():
+                weights = rng.random((explore.sum(), q.shape[1]))
+                actions[explore] = (
+                    weights * encoding.valid[states[explore]]).argmax(axis=1)
+
+            # Make moves
+            mover = turn[active]
+            opponent = 1 - mover
+            last_state[mover, active] = states
+            last_action[mover, active] = actions
+            new_states = states - encoding.action_counts[actions] * \
+                places[encoding.action_piles[actions]]
+            over = new_states == 0
+
+            # Taking the last object loses, which the opponent's last
+            # move is rewarded for; otherwise there are no rewards yet
+            previous_states = last_state[opponent, active]
+            previous_actions = last_action[opponent, active]
+            previous = previous_states >= 0
+            update(
+                np.concatenate((states[over], previous_states[previous])),
+                np.concatenate((actions[over], previous_actions[previous])),
+                np.concatenate((new_states[over], new_states[previous])),
+                np.concatenate((
+                    np.full(over.sum(), -1.0), over[previous].astype(float)))
+            )
+
+            state[active] = new_states
+            turn[active] = opponent
+            active = active[~over]
+
+
+def train_local(q, initial, n, batch, seed):
+    """
+    Plays `n` batched games from the piles `initial`, starting from the
+    Q-table array `q`, and returns the resulting array.
+    """
+    player = NimAI(initial=initial)
+    player.q = q.copy()
+    play_batches(player, n, initial, batch, np.random.default_rng(seed))
+    return player.q
+
+
+def train_parallel(n, initial=[1, 3, 5, 7], workers=None, syncs=10,
+                   batch=4096, seed=None):
+    """
+    Train an AI with a Q-table array by playing `n` games against
+    itself across `workers` processes (all available CPUs if None, or
+    in this process if 1). Play is split into `syncs` rounds: each
+    worker trains its own copy of the table on its share of a round's
+    games, then the copies are averaged into the table the next round
+    starts from.
+
+    After each round, prints the games played and time taken so far,
+    the mean change of the Q-values over the round and the share of
+    states whose best action changed, to show how training converges.
+    """
+    if workers is None:
+        workers = os.cpu_count()
+    player = NimAI(initial=initial)
+    seeds = np.random.SeedSequence(seed).spawn(syncs * workers)
+    known = np.isfinite(player.q)
+    played = 0
+
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    mapper = executor.map if executor is not None else map
+    start = time.perf_counter()
+    try:
+        for sync in range(syncs):
+
+            # Share out this round's games among the workers
+            games = n * (sync + 1) // syncs - played
+            counts = [
+                games * (k + 1) // workers - games * k // workers
+                for k in range(workers)
+            ]
+            tables = list(mapper(
+                train_local, [player.q] * workers, [initial] * workers,
+                counts, [batch] * workers,
+                seeds[sync * workers:(sync + 1) * workers]
+            ))
+
+            # Merge the workers' tables by averaging
+            merged = np.mean(tables, axis=0)
+            change = np.abs(merged[known] - player.q[known]).mean()
+            moved = player.q.argmax(axis=1) != merged.argmax(axis=1)
+            player.q = merged
+            played += games
+
+            print(
+                f"Sync {sync + 1}/{syncs}: {played} games, "
+                f"{time.perf_counter() - start:.2f}s, "
+                f"mean |dQ| {change:.4f}, "
+                f"best action changed in {moved[1:].mean():.1%} of states"
+            )
+    finally:
+        if executor is not None:
+            executor.shutdown()
 
     print("Done training")
-    print(player.q)
-    print(len(player.q))
 
     # Return the trained AI
     return player
@@ -237,6 +652,9 @@ def play(ai, human_player=None):
     Play human game against the AI.
     `human_player` can be set to 0 or 1 to specify whether
     human player moves first or second.
+
+    The game starts from the piles the AI's Q-table array covers,
+    if it has one.
     """
 
     # If no player order set, choose human's order randomly
@@ -244,7 +662,10 @@ def play(ai, human_player=None):
         human_player = random.randint(0, 1)
 
     # Create new game
-    game = Nim()
+    if ai.encoding is not None:
+        game = Nim(ai.encoding.initial)
+    else:
+        game = Nim()
 
     # Game loop
     while True:
@@ -1,4 +1,13 @@
-from nim import train, play
+import os
 
-ai = train(10000)
+from nim import NimAI, train, play
+
+# Q-table saved by the first run, so later runs start at once
+Q_TABLE = "q.npy"
+
+if os.path.exists(Q_TABLE):
+    ai = NimAI.load(Q_TABLE)
+else:
+    ai = train(10000)
+    ai.save(Q_TABLE)
 play(ai)
@@ -0,0 +1,133 @@
+import argparse
+import functools
+import operator
+
+import numpy as np
+
+from nim import NimAI, StateEncoding, play_batches
+
+# In misère Nim the player who takes the last object loses. While some
+# pile holds more than one object, the player to move wins exactly when
+# the nim-sum (xor) of the piles is not 0, as in normal play; once every
+# pile holds at most one, they win when an even number of piles is left.
+
+
+def nim_sum(piles):
+    """
+    Returns the xor of all pile sizes.
+    """
+    return functools.reduce(operator.xor, piles, 0)
+
+
+def mover_wins(piles):
+    """
+    Returns True if the player to move with the piles `piles` wins with
+    best play. With no objects left, the previous player took the last
+    one, so the player to move has already won.
+    """
+    if all(pile <= 1 for pile in piles):
+        return sum(piles) % 2 == 0
+    return nim_sum(piles) != 0
+
+
+def winning_actions(piles):
+    """
+    Returns the list of actions `(i, j)` that leave the opponent in a
+    lost position, which is empty if the player to move cannot win.
+    """
+    big = [i for i, pile in enumerate(piles) if pile > 1]
+    ones = sum(pile == 1 for pile in piles)
+
+    # Only piles of one: taking one wins if that leaves an odd number
+    if not big:
+        if ones % 2 == 1:
+            return []
+        return [(i, 1) for i, pile in enumerate(piles) if pile == 1]
+
+    # One big pile: empty it or leave one, so an odd number of ones remain
+    if len(big) == 1:
+        i = big[0]
+        keep = 1 if ones % 2 == 0 else 0
+        return [(i, piles[i] - keep)]
+
+    # Otherwise, as in normal play, move to a nim-sum of 0
+    total = nim_sum(piles)
+    return [
+        (i, pile - (pile ^ total))
+        for i, pile in enumerate(piles) if pile ^ total < pile
+    ]
+
+
+@functools.lru_cache(maxsize=16)
+def winning_table(initial):
+    """
+    Returns a boolean array with a row per state reachable from the
+    pile tuple `initial` and a column per action, numbered as by
+    `StateEncoding`, that is True where the action wins.
+    """
+    encoding = StateEncoding(initial)
+    piles = encoding.piles
+    big = (piles > 1).sum(axis=1)
+    ones = (piles == 1).sum(axis=1)
+    total = np.bitwise_xor.reduce(piles, axis=1)
+    wins = np.where(big == 0, ones % 2 == 0, total != 0)
+
+    # An action wins if the player to move next loses
+    places = np.array(encoding.places)
+    steps = encoding.action_counts * places[encoding.action_piles]
+    states = np.arange(encoding.size)[:, np.newaxis]
+    following = np.where(encoding.valid, states - steps, 0)
+    return encoding.valid & ~wins[following]
+
+
+def accuracy(ai, initial):
+    """
+    Compares the action `ai` chooses without exploring against the
+    winning actions in every state reachable from the piles `initial`
+    where one exists, and returns the share of those states where the
+    AI chooses a winning action. In the other states, every action
+    loses against best play.
+    """
+    initial = tuple(initial)
+    table = winning_table(initial)
+    encoding = StateEncoding(initial)
+    winnable = np.flatnonzero(table.any(axis=1))
+
+    if ai.encoding is not None and not ai.symmetric and \
+            ai.encoding.initial == list(initial):
+        chosen = ai.q[winnable].argmax(axis=1)
+    else:
+        chosen = np.array([
+            encoding.action_index(ai.choose_action(
+                list(encoding.piles[state]), epsilon=False))
+            for state in winnable
+        ], dtype=int)
+    return float(table[winnable, chosen].mean())
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Train a Nim AI until it plays every position perfectly.")
+    parser.add_argument("piles", type=int, nargs="*", default=[1, 3, 5, 7])
+    parser.add_argument("--games", type=int, default=10000000,
+                        help="most games to train for")
+    parser.add_argument("--every", type=int, default=100000,
+                        help="games between accuracy checks")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    ai = NimAI(initial=args.piles)
+    rng = np.random.default_rng(args.seed)
+    played = 0
+    while played < args.games:
+        games = min(args.every, args.games - played)
+        play_batches(ai, games, args.piles, 4096, rng)
+        played += games
+        score = accuracy(ai, args.piles)
+        print(f"{played} games: {score:.2%} of winnable positions won")
+        if score == 1:
+            break
+
+
+if __name__ == "__main__":
+    main()